@@ -2,7 +2,14 @@ from aqt import mw
 from aqt.qt import *
 from aqt.gui_hooks import browser_will_show_context_menu
 from .tag_input_widget import TagInputWidget
-from .exporter import export_to_html_gui
+from .tag_index import TagIndexCache
+from .card_count import CardCounter
+from .exporter import build_query, export_to_html_gui
+from .instrumentation import format_summary
+from .progress import format_progress
+from .media_cache import MediaCache
+from .images import ImageProcessor
+from .sources import AnkiConnectSource, CollectionSource
 import os
 import traceback
 from PyQt6.QtWidgets import QMessageBox
@@ -20,15 +27,21 @@ def check_anki_connect_installed():
 
 class ExportWorker(QThread):
     progress = pyqtSignal(int)
+    # cards, total, media, bytes written, cards per second, eta in seconds (-1 while unknown)
+    details = pyqtSignal(int, int, int, int, float, float)
+    status = pyqtSignal(str)
     finished = pyqtSignal(int)
     error = pyqtSignal(str)
+    report = pyqtSignal(str)
 
-    def __init__(self, deck, tags, output_path, stop_check):
+    def __init__(self, deck, tags, output_path, stop_check, source=None, **export_options):
         super().__init__()
         self.deck = deck
         self.tags = tags
         self.output_path = output_path
         self.stop_check = stop_check
+        self.source = source
+        self.export_options = export_options
 
     def run(self):
         try:
@@ -36,16 +49,36 @@ class ExportWorker(QThread):
                 deck_name=self.deck,
                 tags=self.tags,
                 output_base=self.output_path,
-                progress_callback=lambda c, t: self.progress.emit(int((c / t) * 100)) if t else 0,
+                progress_callback=self.report_progress,
                 stop_flag=self.stop_check,
+                source=self.source,
+                observer=self.observe,
+                **self.export_options,
             )
             self.finished.emit(result)
         except Exception as e:
             traceback.print_exc()
             self.error.emit(str(e))
-
-
-def generate_folder_name(deck, tags):
+        finally:
+            if self.export_options.get("image_processor"):
+                self.export_options["image_processor"].close()
+
+    def report_progress(self, progress):
+        # Called by the throttled reporter, never once per card
+        self.progress.emit(progress["percent"])
+        eta = progress["eta"]
+        self.details.emit(progress["cards"], progress["total"], progress["media"], progress["bytes"],
+                          progress["cards_per_second"], -1.0 if eta is None else eta)
+        self.status.emit(format_progress(progress))
+
+    def observe(self, event, data):
+        if event == "report":
+            self.report.emit(format_summary(data))
+
+
+def generate_folder_name(deck, tags, note_ids=None):
+    if note_ids:
+        return f"Anki_Export_Selected_{len(note_ids)}_Notes"
     name_parts = ["Anki_Export"]
     if deck:
         name_parts.append(deck.replace(" ", "_"))
@@ -54,11 +87,52 @@ def generate_folder_name(deck, tags):
     return "_".join(name_parts)
 
 
-def show_export_dialog():
-    if not check_anki_connect_installed():
-        return  # Exit silently if missing
+# Built on the first keystroke and reused across dialog openings until the collection changes
+tag_index_cache = TagIndexCache()
+
+SOURCE_COLLECTION = "Collection (in-process)"
+SOURCE_ANKICONNECT = "AnkiConnect"
+
+
+def create_source(source_name):
+    if source_name == SOURCE_ANKICONNECT:
+        return AnkiConnectSource()
+    return CollectionSource(mw.col)
+
+
+def addon_config():
+    return mw.addonManager.getConfig(__name__) or {}
+
+
+def create_media_cache():
+    cache_config = addon_config().get("media_cache", {})
+    if not cache_config.get("enabled"):
+        return None
+    root = cache_config.get("path") or os.path.join(
+        mw.addonManager.addonsFolder(__name__), "user_files", "media_cache"
+    )
+    return MediaCache(root, max_bytes=int(cache_config.get("max_mb", 2048)) * 1024 * 1024)
+
+
+def create_image_processor():
+    image_config = addon_config().get("images", {})
+    root = image_config.get("cache_path") or os.path.join(
+        mw.addonManager.addonsFolder(__name__), "user_files", "image_cache"
+    )
+    return ImageProcessor(
+        max_dimension=int(image_config.get("max_dimension", 1600)),
+        quality=int(image_config.get("quality", 80)),
+        image_format=image_config.get("format", "webp"),
+        srcset=image_config.get("srcset", True),
+        workers=int(image_config.get("workers", 0)) or None,
+        cache_dir=root,
+        max_cache_bytes=int(image_config.get("cache_mb", 1024)) * 1024 * 1024,
+    )
+
+
+def show_export_dialog(note_ids=None):
     dialog = QDialog(mw, Qt.WindowType.Window)
-    dialog.setWindowTitle("Export to HTML")
+    dialog.setWindowTitle("Export Selected Notes to HTML" if note_ids else "Export to HTML")
     dialog.resize(1300, 500)
     dialog.setMinimumSize(1300, 500)  
     dialog.setSizeGripEnabled(True) 
@@ -75,11 +149,22 @@ def show_export_dialog():
 
     # Tag input
     tag_label = QLabel("Enter tags:")
-    all_tags = mw.col.tags.all()
-    tag_input_widget = TagInputWidget(all_tags)
+    tag_input_widget = TagInputWidget(lambda: tag_index_cache.get(mw.col.mod, mw.col.tags.all))
     layout.addWidget(tag_label)
     layout.addWidget(tag_input_widget)
 
+    if note_ids:
+        # The Browser selection replaces the deck and tag filters
+        for widget in (deck_label, deck_dropdown, tag_label, tag_input_widget):
+            widget.setEnabled(False)
+
+    # Data source
+    source_label = QLabel("Read cards from:")
+    source_dropdown = QComboBox()
+    source_dropdown.addItems([SOURCE_COLLECTION, SOURCE_ANKICONNECT])
+    layout.addWidget(source_label)
+    layout.addWidget(source_dropdown)
+
     # Folder selection
     path_label = QLabel("Save to destination:")
     folder_input = QLineEdit()
@@ -90,6 +175,48 @@ def show_export_dialog():
     layout.addWidget(path_label)
     layout.addLayout(path_layout)
 
+    incremental_checkbox = QCheckBox("Update existing export (only re-render changed cards)")
+    layout.addWidget(incremental_checkbox)
+
+    resume_checkbox = QCheckBox("Resume an interrupted export into this folder")
+    resume_checkbox.setChecked(True)
+    layout.addWidget(resume_checkbox)
+
+    sidecar_checkbox = QCheckBox("Load extra fields on demand (smaller pages for large exports)")
+    layout.addWidget(sidecar_checkbox)
+
+    note_mode_checkbox = QCheckBox("Group sibling cards under their note (fields and tags shown once per note)")
+    layout.addWidget(note_mode_checkbox)
+
+    search_checkbox = QCheckBox("Add a search box to the exported pages (builds a search index)")
+    search_checkbox.setChecked(True)
+    layout.addWidget(search_checkbox)
+
+    images_checkbox = QCheckBox("Downscale images and load them lazily (smaller exports, faster on tablets)")
+    images_checkbox.setChecked(bool(addon_config().get("images", {}).get("enabled")))
+    layout.addWidget(images_checkbox)
+
+    archive_checkbox = QCheckBox("Write a single .zip archive instead of a folder (open it with archive-viewer.html)")
+    layout.addWidget(archive_checkbox)
+
+    def on_archive_toggled(checked):
+        # An archive is written in one pass, so there is nothing to update or resume
+        incremental_checkbox.setEnabled(not checked)
+        resume_checkbox.setEnabled(not checked)
+
+    archive_checkbox.toggled.connect(on_archive_toggled)
+
+    pages_label = QLabel("Cards per page (0 = single index.html):")
+    pages_spinbox = QSpinBox()
+    pages_spinbox.setRange(0, 100000)
+    pages_spinbox.setSingleStep(500)
+    pages_spinbox.setValue(0)
+    pages_layout = QHBoxLayout()
+    pages_layout.addWidget(pages_label)
+    pages_layout.addWidget(pages_spinbox)
+    pages_layout.addStretch()
+    layout.addLayout(pages_layout)
+
     def browse():
         folder = QFileDialog.getExistingDirectory(dialog, "Select Export Folder")
         if folder:
@@ -98,7 +225,7 @@ def show_export_dialog():
     browse_button.clicked.connect(browse)
 
     # Card count
-    card_count_label = QLabel("Matching cards: 0")
+    card_count_label = QLabel(f"Selected notes: {len(note_ids)}" if note_ids else "Matching cards: 0")
     layout.addWidget(card_count_label)
 
     # Progress bar + stop
@@ -110,8 +237,10 @@ def show_export_dialog():
     progress_layout = QHBoxLayout()
     progress_layout.addWidget(progress_bar)
     progress_layout.addWidget(stop_button)
+    progress_status_label = QLabel("")
     layout.addWidget(progress_label)
     layout.addLayout(progress_layout)
+    layout.addWidget(progress_status_label)
 
     # Control buttons
     button_layout = QHBoxLayout()
@@ -129,25 +258,25 @@ def show_export_dialog():
     # Internal state
     stop_requested = False
     worker = None
+    export_summary = ""
+
+    card_counter = CardCounter(dialog)
+    card_counter.started.connect(lambda: card_count_label.setText("Matching cards: counting..."))
+    card_counter.counted.connect(lambda count: card_count_label.setText(f"Matching cards: {count}"))
+
+    def on_count_failed(message):
+        card_count_label.setText("Matching cards: error")
+        print("Query error:", message)
+
+    card_counter.failed.connect(on_count_failed)
 
     def update_card_count():
+        if note_ids:
+            return
         deck = deck_dropdown.currentText()
         if deck == "All Decks":
             deck = None
-        tags = tag_input_widget.get_tags()
-        query_parts = []
-        if deck:
-            query_parts.append(f'deck:"{deck}"')
-        if tags:
-            for tag in tags:
-                query_parts.append(f'tag:"{tag}"')
-        query = " ".join(query_parts)
-        try:
-            count = len(mw.col.find_cards(query)) if query else 0
-            card_count_label.setText(f"Matching cards: {count}")
-        except Exception as e:
-            card_count_label.setText("Matching cards: error")
-            print("Query error:", e)
+        card_counter.request(build_query(deck, tag_input_widget.get_tags()))
 
     # Connections
     cancel_button.clicked.connect(lambda: on_cancel())
@@ -166,8 +295,13 @@ def show_export_dialog():
     stop_button.clicked.connect(on_stop)
 
     def run_export():
-        nonlocal stop_requested, worker
+        nonlocal stop_requested, worker, export_summary
+        source_name = source_dropdown.currentText()
+        if source_name == SOURCE_ANKICONNECT and not check_anki_connect_installed():
+            return
         stop_requested = False
+        export_summary = ""
+        progress_status_label.setText("")
         stop_button.setEnabled(True)
         export_button.setEnabled(False)
         export_button.setText("Exporting...")
@@ -184,24 +318,46 @@ def show_export_dialog():
             reset_export_ui()
             return
 
-        if not deck and not tags:
+        if not note_ids and not deck and not tags:
             QMessageBox.warning(dialog, "Missing Filters", "Please provide a deck or tags.")
             reset_export_ui()
             return
 
-        folder_name = generate_folder_name(deck, tags)
+        if note_ids:
+            deck, tags = None, []
+        folder_name = generate_folder_name(deck, tags, note_ids)
         output_path = os.path.join(base_folder, folder_name)
-        os.makedirs(output_path, exist_ok=True)
+        if not archive_checkbox.isChecked():
+            os.makedirs(output_path, exist_ok=True)
 
         def stop_check():
             return stop_requested
 
-        worker = ExportWorker(deck, tags, output_path, stop_check)
+        worker = ExportWorker(
+            deck, tags, output_path, stop_check, create_source(source_name),
+            note_ids=note_ids,
+            incremental=incremental_checkbox.isChecked() and not archive_checkbox.isChecked(),
+            resume=resume_checkbox.isChecked() and not archive_checkbox.isChecked(),
+            archive=archive_checkbox.isChecked(),
+            search_index=search_checkbox.isChecked(),
+            media_cache=create_media_cache(),
+            image_processor=create_image_processor() if images_checkbox.isChecked() else None,
+            cards_per_page=pages_spinbox.value() or None,
+            sidecar_fields=sidecar_checkbox.isChecked(),
+            note_mode=note_mode_checkbox.isChecked(),
+            render_workers=int(addon_config().get("render_workers", 1)),
+        )
         worker.progress.connect(progress_bar.setValue)
+        worker.status.connect(progress_status_label.setText)
+        worker.report.connect(on_export_report)
         worker.finished.connect(on_export_finished)
         worker.error.connect(on_export_error)
         worker.start()
 
+    def on_export_report(summary):
+        nonlocal export_summary
+        export_summary = summary
+
     def on_export_finished(result):
         stop_button.setEnabled(False)
         export_button.setEnabled(True)
@@ -212,7 +368,10 @@ def show_export_dialog():
         if result == 0:
             QMessageBox.information(dialog, "No Cards", "No matching cards found.")
             return
-        QMessageBox.information(dialog, "Export Complete", f"{result} cards exported.")
+        message = f"{result} cards exported."
+        if export_summary:
+            message += f"\n\n{export_summary}"
+        QMessageBox.information(dialog, "Export Complete", message)
 
     def on_export_error(msg):
         stop_button.setEnabled(False)
@@ -248,8 +407,21 @@ def show_export_dialog():
 
 def add_menu_entry():
     action = QAction("Export to HTML (Deck/Tag)", mw)
-    action.triggered.connect(show_export_dialog)
+    action.triggered.connect(lambda: show_export_dialog())
     mw.form.menuTools.addAction(action)
 
 
+def export_browser_selection(browser):
+    note_ids = list(browser.selected_notes())
+    if note_ids:
+        show_export_dialog(note_ids)
+
+
+def add_browser_menu_entry(browser, menu):
+    menu.addSeparator()
+    action = menu.addAction("Export Selected Notes to HTML")
+    action.triggered.connect(lambda: export_browser_selection(browser))
+
+
 add_menu_entry()
+browser_will_show_context_menu.append(add_browser_menu_entry)
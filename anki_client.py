@@ -0,0 +1,124 @@
+import http.client
+import json
+import queue
+import socket
+import time
+import urllib.parse
+
+ANKI_CONNECT_URL = "http://localhost:8765"
+ANKI_CONNECT_VERSION = 6
+
+
+class AnkiConnectError(Exception):
+    pass
+
+
+class AnkiConnectUnavailable(AnkiConnectError):
+    pass
+
+
+class AnkiConnectActionError(AnkiConnectError):
+    def __init__(self, action, message):
+        super().__init__(f"{action}: {message}")
+        self.action = action
+        self.message = message
+
+
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    socket.timeout,
+    http.client.BadStatusLine,
+    http.client.IncompleteRead,
+)
+
+
+class AnkiConnectClient:
+    def __init__(self, url=ANKI_CONNECT_URL, timeout=30, connect_timeout=5, pool_size=4,
+                 retries=3, backoff=0.25):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 8765
+        self.path = parsed.path or "/"
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _new_connection(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.timeout)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _post(self, payload):
+        conn = self._acquire()
+        try:
+            conn.request("POST", self.path, body=payload, headers={
+                "Content-Type": "application/json",
+                "Connection": "keep-alive",
+            })
+            response = conn.getresponse()
+            body = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return response.status, body
+
+    def request(self, action, params=None):
+        payload = json.dumps({
+            "action": action,
+            "version": ANKI_CONNECT_VERSION,
+            "params": params or {}
+        }).encode("utf-8")
+
+        attempt = 0
+        while True:
+            try:
+                status, body = self._post(payload)
+                if status >= 500:
+                    raise ConnectionError(f"HTTP Error {status}")
+                break
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise AnkiConnectUnavailable(
+                        f"AnkiConnect unreachable at {self.host}:{self.port} ({e})"
+                    ) from e
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+        if status != 200:
+            raise AnkiConnectError(f"HTTP Error {status} for {action}")
+        result = json.loads(body)
+        if result.get("error"):
+            raise AnkiConnectActionError(action, result["error"])
+        return result["result"]
+
+    def multi(self, actions):
+        return self.request("multi", {"actions": [
+            {"action": action, "version": ANKI_CONNECT_VERSION, "params": params or {}}
+            for action, params in actions
+        ]})
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
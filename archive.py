@@ -0,0 +1,346 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+from .media import HEADER_SIZE, sniff_media_type
+
+ARCHIVE_SUFFIX = ".zip"
+VIEWER_NAME = "archive-viewer.html"
+SPOOL_SIZE = 16 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+# Deflating formats that are already compressed costs CPU and saves nothing
+STORED_MEDIA_TYPES = {
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "image/heic",
+    "audio/mpeg", "audio/ogg", "audio/flac", "audio/mp4", "video/mp4", "video/webm",
+}
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset='utf-8'><title>Anki HTML Export Viewer</title>
+<meta name='viewport' content='width=device-width, initial-scale=1'>
+<style>
+    html, body { height: 100%; margin: 0; }
+    body { font-family: Arial, sans-serif; background: #121212; color: #ffffff; display: flex; flex-direction: column; }
+    header { display: flex; gap: 12px; align-items: center; padding: 8px 12px; background: #1e1e1e; border-bottom: 1px solid #444; }
+    header span { color: #aaa; font-size: 13px; }
+    #drop { flex: 1; display: flex; align-items: center; justify-content: center; color: #aaa; border: 2px dashed #444; margin: 20px; border-radius: 8px; }
+    iframe { flex: 1; width: 100%; border: 0; display: none; background: #121212; }
+</style></head>
+<body>
+<header><input type='file' id='file' accept='.zip'><span id='status'>Open an exported .zip archive</span></header>
+<div id='drop'>Drop an exported .zip archive here</div>
+<iframe id='page'></iframe>
+<script>
+    // Reads the archive in place: the central directory is parsed once, stored
+    // media become Blob slices of the file and only deflated entries are inflated.
+    var TYPES = {
+        png: "image/png", jpg: "image/jpeg", jpeg: "image/jpeg", gif: "image/gif", webp: "image/webp",
+        svg: "image/svg+xml", bmp: "image/bmp", ico: "image/x-icon", avif: "image/avif", tif: "image/tiff",
+        tiff: "image/tiff", mp3: "audio/mpeg", ogg: "audio/ogg", oga: "audio/ogg", wav: "audio/wav",
+        flac: "audio/flac", m4a: "audio/mp4", mp4: "video/mp4", webm: "video/webm", css: "text/css",
+        js: "text/javascript", html: "text/html", json: "application/json"
+    };
+    var REF_RE = /\\b(src|href)=(["'])(.*?)\\2/g;
+    // Only src and href are resolved, so scaled images show their largest variant
+    var SRCSET_RE = /\\s(srcset|sizes)=(["']).*?\\2/g;
+    var archive = null;
+    var urls = new Map();
+    var frame = document.getElementById("page");
+    var statusLine = document.getElementById("status");
+    var drop = document.getElementById("drop");
+    var input = document.getElementById("file");
+
+    function typeOf(name) {
+        return TYPES[name.split(".").pop().toLowerCase()] || "application/octet-stream";
+    }
+
+    async function readBytes(file, start, end) {
+        return new Uint8Array(await file.slice(start, end).arrayBuffer());
+    }
+
+    async function readEntries(file) {
+        var tailStart = Math.max(0, file.size - 65557 - 20);
+        var tail = await readBytes(file, tailStart, file.size);
+        var view = new DataView(tail.buffer);
+        var end = -1;
+        for (var i = tail.length - 22; i >= 0; i--) {
+            if (view.getUint32(i, true) === 0x06054b50) { end = i; break; }
+        }
+        if (end < 0) throw new Error(file.name + " is not a zip archive");
+        var count = view.getUint16(end + 10, true);
+        var size = view.getUint32(end + 12, true);
+        var offset = view.getUint32(end + 16, true);
+        var locator = end - 20;
+        if (locator >= 0 && view.getUint32(locator, true) === 0x07064b50) {
+            var recordOffset = Number(view.getBigUint64(locator + 8, true));
+            var record = new DataView((await readBytes(file, recordOffset, recordOffset + 56)).buffer);
+            count = Number(record.getBigUint64(32, true));
+            size = Number(record.getBigUint64(40, true));
+            offset = Number(record.getBigUint64(48, true));
+        }
+        var directory = await readBytes(file, offset, offset + size);
+        var dir = new DataView(directory.buffer);
+        var decoder = new TextDecoder();
+        var entries = new Map();
+        var pos = 0;
+        for (var n = 0; n < count && dir.getUint32(pos, true) === 0x02014b50; n++) {
+            var entry = {
+                method: dir.getUint16(pos + 10, true),
+                compressedSize: dir.getUint32(pos + 20, true),
+                size: dir.getUint32(pos + 24, true),
+                offset: dir.getUint32(pos + 42, true)
+            };
+            var nameLength = dir.getUint16(pos + 28, true);
+            var extra = pos + 46 + nameLength;
+            var extraEnd = extra + dir.getUint16(pos + 30, true);
+            // The ZIP64 field holds whichever sizes and offset overflowed, in this order
+            while (extra + 4 <= extraEnd) {
+                var id = dir.getUint16(extra, true), length = dir.getUint16(extra + 2, true), field = extra + 4;
+                if (id === 1) {
+                    if (entry.size === 0xffffffff) { entry.size = Number(dir.getBigUint64(field, true)); field += 8; }
+                    if (entry.compressedSize === 0xffffffff) { entry.compressedSize = Number(dir.getBigUint64(field, true)); field += 8; }
+                    if (entry.offset === 0xffffffff) { entry.offset = Number(dir.getBigUint64(field, true)); }
+                }
+                extra += 4 + length;
+            }
+            entries.set(decoder.decode(directory.subarray(pos + 46, pos + 46 + nameLength)), entry);
+            pos = extraEnd + dir.getUint16(pos + 32, true);
+        }
+        return entries;
+    }
+
+    async function entryBlob(name) {
+        var entry = archive.entries.get(archive.root + name);
+        if (!entry) return null;
+        var header = new DataView((await readBytes(archive.file, entry.offset, entry.offset + 30)).buffer);
+        var start = entry.offset + 30 + header.getUint16(26, true) + header.getUint16(28, true);
+        var data = archive.file.slice(start, start + entry.compressedSize, typeOf(name));
+        if (entry.method === 0) return data;
+        var inflated = data.stream().pipeThrough(new DecompressionStream("deflate-raw"));
+        return new Blob([await new Response(inflated).arrayBuffer()], {type: typeOf(name)});
+    }
+
+    function resolve(name) {
+        if (!urls.has(name)) {
+            urls.set(name, entryBlob(name).then(function (blob) { return blob && URL.createObjectURL(blob); }));
+        }
+        return urls.get(name);
+    }
+
+    function entryName(value) {
+        var name = value.replace(/&amp;/g, "&").replace(/&#x27;/g, "'").replace(/&quot;/g, '"')
+            .split("#")[0].split("?")[0].replace(/^\\.\\//, "");
+        try { name = decodeURIComponent(name); } catch (e) {}
+        return name;
+    }
+
+    async function rewrite(html) {
+        // Every src/href naming a file in the archive gets its blob URL; pages
+        // stay as they are and are opened by the click handler instead
+        var names = new Set();
+        html.replace(REF_RE, function (match, attr, quote, value) {
+            var name = entryName(value);
+            if (name && !name.endsWith(".html") && archive.entries.has(archive.root + name)) names.add(name);
+            return match;
+        });
+        var resolved = new Map();
+        await Promise.all(Array.from(names, function (name) {
+            return resolve(name).then(function (url) { resolved.set(name, url); });
+        }));
+        return html.replace(SRCSET_RE, "").replace(REF_RE, function (match, attr, quote, value) {
+            var url = resolved.get(entryName(value));
+            return url ? attr + "=" + quote + url + quote : match;
+        });
+    }
+
+    function scrollToCard(doc, hash) {
+        var target = hash && doc.getElementById(decodeURIComponent(hash));
+        if (target) target.scrollIntoView();
+    }
+
+    function attach(hash) {
+        var win = frame.contentWindow, doc = frame.contentDocument;
+        var index = win.CARD_INDEX, page = hash && index && index.cards[hash];
+        if (page) { show(index.pages[page - 1], hash); return; }
+        var writeExtraInfo = win.writeExtraInfo;
+        if (writeExtraInfo) {
+            win.writeExtraInfo = function (newWindow, content, isImage, isURL) {
+                if (isURL) {
+                    writeExtraInfo(newWindow, content, isImage, isURL);
+                } else if (isImage) {
+                    resolve(entryName(content)).then(function (url) { writeExtraInfo(newWindow, url || content, true, false); });
+                } else {
+                    rewrite(decodeURIComponent(content)).then(function (html) {
+                        writeExtraInfo(newWindow, encodeURIComponent(html), false, false);
+                    });
+                }
+            };
+        }
+        win.loadScript = function (src) {
+            resolve(entryName(src)).then(function (url) {
+                var script = doc.createElement("script");
+                script.src = url || src;
+                doc.head.appendChild(script);
+            });
+        };
+        doc.addEventListener("click", function (event) {
+            var link = event.target.closest("a[href]");
+            if (!link) return;
+            var href = link.getAttribute("href");
+            var target = entryName(href);
+            var linkHash = href.indexOf("#") >= 0 ? href.slice(href.indexOf("#") + 1) : "";
+            event.preventDefault();
+            if (!target) {
+                scrollToCard(doc, linkHash);
+            } else if (archive.entries.has(archive.root + target)) {
+                show(target, linkHash);
+            } else {
+                window.open(href, "_blank");
+            }
+        });
+        scrollToCard(doc, hash);
+    }
+
+    async function show(name, hash) {
+        var blob = await entryBlob(name);
+        if (!blob) { statusLine.textContent = name + " is not in the archive"; return; }
+        var html = await rewrite(await blob.text());
+        frame.onload = function () { attach(hash); };
+        frame.srcdoc = html;
+    }
+
+    async function openArchive(file) {
+        urls.forEach(function (url) { url.then(function (value) { if (value) URL.revokeObjectURL(value); }); });
+        urls = new Map();
+        var entries = await readEntries(file);
+        var index = Array.from(entries.keys())
+            .filter(function (name) { return name === "index.html" || name.endsWith("/index.html"); })
+            .sort(function (a, b) { return a.length - b.length; })[0];
+        if (!index) throw new Error("No index.html in " + file.name);
+        archive = {file: file, entries: entries, root: index.slice(0, -"index.html".length)};
+        drop.style.display = "none";
+        frame.style.display = "block";
+        statusLine.textContent = file.name + " \\u00b7 " + entries.size + " files";
+        await show("index.html", location.hash.slice(1));
+    }
+
+    function open(file) {
+        if (file) openArchive(file).catch(function (e) { statusLine.textContent = e.message; });
+    }
+
+    input.addEventListener("change", function () { open(input.files[0]); });
+    document.addEventListener("dragover", function (event) { event.preventDefault(); });
+    document.addEventListener("drop", function (event) {
+        event.preventDefault();
+        open(event.dataTransfer.files[0]);
+    });
+</script>
+</body></html>
+"""
+
+
+def archive_path(output_base):
+    output_base = os.path.abspath(output_base)
+    return output_base if output_base.endswith(ARCHIVE_SUFFIX) else output_base + ARCHIVE_SUFFIX
+
+
+def compress_type(header):
+    if sniff_media_type(header) in STORED_MEDIA_TYPES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def write_viewer(folder):
+    path = os.path.join(folder, VIEWER_NAME)
+    data = VIEWER_HTML.encode("utf-8")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return path
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+class ArchiveEntry:
+    # zipfile allows one open write handle at a time and pages stay open while
+    # the next batch of media is added, so a page is spooled and copied in on close.
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.name = name
+        self._spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+
+    def write(self, data):
+        return self._spool.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._spool is None:
+            return
+        size = self._spool.tell()
+        self._spool.seek(0)
+        self.archive.write_stream(self.name, self._spool, size)
+        self._spool.close()
+        self._spool = None
+
+
+class ExportArchive:
+    # Every file of the export goes straight into one zip under a root folder
+    # named after the export, so extracting it gives the usual export folder.
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root.rstrip("/") + "/"
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True, strict_timestamps=False)
+        self._sizes = {}
+
+    def _info(self, name, size, compression):
+        info = zipfile.ZipInfo(self.root + name, time.localtime()[:6])
+        info.compress_type = compression
+        info.file_size = size
+        info.external_attr = 0o644 << 16
+        return info
+
+    def __contains__(self, name):
+        return name in self._sizes
+
+    def getsize(self, name):
+        return self._sizes[name]
+
+    def open(self, name):
+        return ArchiveEntry(self, name)
+
+    def write_stream(self, name, src, size, compression=zipfile.ZIP_DEFLATED):
+        if name in self._sizes:
+            return
+        with self._zip.open(self._info(name, size, compression), "w") as dest:
+            shutil.copyfileobj(src, dest, COPY_CHUNK_SIZE)
+        self._sizes[name] = size
+
+    def write_bytes(self, name, data):
+        if name in self._sizes:
+            return
+        self._zip.writestr(self._info(name, len(data), compress_type(data[:HEADER_SIZE])), data)
+        self._sizes[name] = len(data)
+
+    def write_file(self, name, src_path):
+        if name in self._sizes:
+            return
+        with open(src_path, "rb") as f:
+            compression = compress_type(f.read(HEADER_SIZE))
+            f.seek(0)
+            self.write_stream(name, f, os.fstat(f.fileno()).st_size, compression)
+
+    def write_json(self, name, data):
+        self.write_bytes(name, json.dumps(data, indent=2).encode("utf-8"))
+
+    def close(self):
+        self._zip.close()
+
+    def abort(self):
+        self._zip.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .anki_client import AnkiConnectClient
+from .downloader import ExternalDownloader
+from .exporter import export_to_html_gui
+from .sources import AnkiConnectSource
+
+SUMMARY_NAME = "export_summary.json"
+# Job keys forwarded to export_to_html_gui as they are
+EXPORT_OPTIONS = (
+    "page_size", "media_mode", "incremental", "cards_per_page", "sidecar_fields", "render_workers", "resume",
+    "note_mode", "archive", "search_index",
+)
+
+
+def load_jobs(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    defaults = data.get("defaults", {})
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for number, job in enumerate(data.get("jobs", []), 1):
+        job = {**defaults, **job}
+        if not job.get("output"):
+            raise ValueError(f"Job {number} has no output path")
+        if not job.get("deck") and not job.get("tags") and not job.get("note_ids"):
+            raise ValueError(f"Job {number} needs a deck, tags or note_ids")
+        job.setdefault("name", f"job-{number}")
+        # Relative output paths are relative to the job file
+        job["output"] = os.path.join(base_dir, os.path.expanduser(job["output"]))
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job, source, downloader=None, media_cache=None, stop_flag=None, image_processor=None):
+    started = time.perf_counter()
+    summary = {"name": job["name"], "output": job["output"], "status": "ok", "cards": 0}
+    try:
+        if not job.get("archive"):
+            os.makedirs(job["output"], exist_ok=True)
+        summary["cards"] = export_to_html_gui(
+            deck_name=job.get("deck"),
+            tags=job.get("tags"),
+            note_ids=job.get("note_ids"),
+            output_base=job["output"],
+            stop_flag=stop_flag,
+            source=source,
+            downloader=downloader,
+            media_cache=media_cache,
+            # A job can opt out of the scheduler's image processing with "images": false
+            image_processor=image_processor if job.get("images", True) else None,
+            **{key: job[key] for key in EXPORT_OPTIONS if key in job},
+        )
+        if stop_flag and stop_flag():
+            summary["status"] = "cancelled"
+        elif not summary["cards"]:
+            summary["status"] = "empty"
+    except Exception as e:
+        traceback.print_exc()
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    if os.path.isdir(job["output"]):
+        with open(os.path.join(job["output"], SUMMARY_NAME), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+class BatchScheduler:
+    def __init__(self, max_parallel=2, source=None, downloader=None, media_cache=None, image_processor=None):
+        self.max_parallel = max_parallel
+        # One AnkiConnect connection pool and one media-fetch layer shared by all jobs
+        self.source = source or AnkiConnectSource(AnkiConnectClient(pool_size=max(4, max_parallel * 2)))
+        self._download_dir = None
+        if downloader is None:
+            # Each export swaps its staging folder into place, so shared downloads live elsewhere
+            self._download_dir = tempfile.mkdtemp(prefix="anki-html-downloads-")
+            downloader = ExternalDownloader(cache=media_cache, download_dir=self._download_dir)
+        self.downloader = downloader
+        self.media_cache = media_cache
+        self.image_processor = image_processor
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, jobs, on_job_done=None):
+        summaries = [None] * len(jobs)
+
+        def run_one(index):
+            if self._stop.is_set():
+                summaries[index] = {"name": jobs[index]["name"], "output": jobs[index]["output"],
+                                    "status": "cancelled", "cards": 0, "seconds": 0}
+            else:
+                summaries[index] = run_job(jobs[index], self.source, self.downloader, self.media_cache,
+                                           self._stop.is_set, self.image_processor)
+            if on_job_done:
+                on_job_done(summaries[index])
+
+        executor = ThreadPoolExecutor(self.max_parallel, thread_name_prefix="export-job")
+        try:
+            list(executor.map(run_one, range(len(jobs))))
+        except BaseException:
+            # Ctrl-C lands here: queued jobs are dropped and running ones see the stop flag
+            self._stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        return summaries
+
+    def close(self):
+        self.downloader.close(cancel=True)
+        if self.image_processor:
+            self.image_processor.close()
+        self.source.close()
+        if self._download_dir:
+            shutil.rmtree(self._download_dir, ignore_errors=True)
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from fake_ankiconnect import FakeAnkiConnect, FakeCollection
+from headless import load_addon_module
+
+COLLECTION_KEYS = ("cards", "fields", "media", "media_size", "external_share", "media_per_card", "text_size",
+                   "cards_per_note", "vocabulary", "image_dimension", "seed")
+EXPORT_KEYS = ("page_size", "media_mode", "incremental", "cards_per_page", "sidecar_fields", "render_workers",
+               "note_mode", "archive", "search_index")
+LATENCY_STAGES = ("cards_info", "media_retrieve", "external_downloads", "render", "write")
+
+SCENARIOS = {
+    "small": dict(cards=1_000, fields=4, media=100, media_size=20_000),
+    "large": dict(cards=20_000, fields=6, media=2_000, media_size=50_000, cards_per_page=1000),
+    "remote-media": dict(cards=5_000, fields=4, media=1_000, media_size=50_000, local_media=False),
+    "external": dict(cards=2_000, fields=4, media=400, media_size=20_000, external_share=0.5, latency_ms=20),
+    "latency": dict(cards=5_000, fields=4, media=200, media_size=20_000, latency_ms=25, local_media=False),
+    "incremental": dict(cards=10_000, fields=4, media=500, media_size=20_000, incremental=True, runs=2),
+    "cloze-cards": dict(cards=12_000, fields=6, media=500, media_size=20_000, cards_per_note=6, text_size=2000),
+    "cloze-notes": dict(cards=12_000, fields=6, media=500, media_size=20_000, cards_per_note=6, text_size=2000,
+                        note_mode=True),
+    "selection": dict(cards=60_000, fields=4, media=200, media_size=5_000, cards_per_note=1, selected_notes=50_000),
+    "sidecar-workers": dict(cards=10_000, fields=12, media=500, media_size=20_000, sidecar_fields=True,
+                            render_workers=4, cards_per_page=2000),
+    "media-dir": dict(cards=10_000, fields=4, media=8_000, media_size=25_000, cards_per_page=1000,
+                      media_mode="copy"),
+    "media-zip": dict(cards=10_000, fields=4, media=8_000, media_size=25_000, cards_per_page=1000, archive=True),
+    "search": dict(cards=30_000, fields=4, media=200, media_size=5_000, vocabulary=50_000, cards_per_page=1000,
+                   search_index=True),
+    "images": dict(cards=2_000, fields=4, media=120, image_dimension=3000, cards_per_page=500, max_image_size=1600),
+}
+
+
+def output_files(path):
+    if os.path.isfile(path):
+        return 1, os.path.getsize(path)
+    files = size = 0
+    for folder, _, names in os.walk(path):
+        files += len(names)
+        size += sum(os.path.getsize(os.path.join(folder, name)) for name in names)
+    return files, size
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_export(url, params):
+    # Runs in a fresh interpreter so peak RSS belongs to this scenario alone
+    anki_client = load_addon_module("anki_client")
+    exporter = load_addon_module("exporter")
+    sources = load_addon_module("sources")
+    images = load_addon_module("images")
+
+    output = tempfile.mkdtemp(prefix="bench-export-")
+    output_base = os.path.join(output, "export")
+    options = {key: params[key] for key in EXPORT_KEYS if key in params}
+    image_processor = None
+    if params.get("max_image_size"):
+        image_processor = options["image_processor"] = images.ImageProcessor(params["max_image_size"])
+    if params.get("selected_notes"):
+        # The fake collection numbers its notes from 1,000,000
+        options["note_ids"] = list(range(1_000_000, 1_000_000 + params["selected_notes"]))
+    try:
+        for _ in range(params.get("runs", 1)):
+            durations = {}
+            first_card = []
+
+            def observer(event, data):
+                if event == "stage":
+                    durations.setdefault(data["stage"], []).append(data["seconds"])
+                    if data["stage"] == "write" and not first_card:
+                        first_card.append(time.perf_counter() - started)
+
+            source = sources.AnkiConnectSource(anki_client.AnkiConnectClient(url))
+            started = time.perf_counter()
+            cards = exporter.export_to_html_gui(deck_name=None if "note_ids" in options else "Bench",
+                                                output_base=output_base, source=source,
+                                                observer=observer, **options)
+            elapsed = time.perf_counter() - started
+            source.close()
+        if options.get("archive"):
+            output_base += ".zip"
+            with zipfile.ZipFile(output_base) as archive:
+                report = json.loads(archive.read("export/export_report.json"))
+        else:
+            with open(os.path.join(output_base, "export_report.json"), encoding="utf-8") as f:
+                report = json.load(f)
+        files, size = output_files(output_base)
+    finally:
+        if image_processor:
+            image_processor.close()
+        shutil.rmtree(output, ignore_errors=True)
+
+    counters = report["counters"]
+    media_bytes = counters.get("media_bytes", 0) + counters.get("external_bytes", 0)
+    return {
+        "cards": cards,
+        "seconds": round(elapsed, 3),
+        "cards_per_second": round(cards / elapsed, 1),
+        "media_mb_per_second": round(media_bytes / elapsed / 1024 / 1024, 2),
+        "first_card_ms": round(first_card[0] * 1000, 1) if first_card else None,
+        "peak_rss_mb": round(report["peak_rss_bytes"] / 1024 / 1024, 1) if report["peak_rss_bytes"] else None,
+        "latency_ms": {
+            stage: {label: round(percentile(durations[stage], fraction) * 1000, 3)
+                    for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+            for stage in LATENCY_STAGES if stage in durations
+        },
+        "html_mb": round(counters.get("html_bytes", 0) / 1024 / 1024, 2),
+        "output_files": files,
+        "output_mb": round(size / 1024 / 1024, 2),
+        "stages": {name: stage["seconds"] for name, stage in report["stages"].items()},
+        "counters": counters,
+    }
+
+
+def run_scenario(name, params):
+    collection = FakeCollection(**{key: params[key] for key in COLLECTION_KEYS if key in params})
+    media_dir = None
+    if params.get("local_media", True):
+        media_dir = tempfile.mkdtemp(prefix="bench-media-")
+        collection.write_media_dir(media_dir)
+    server = FakeAnkiConnect(collection, latency=params.get("latency_ms", 0) / 1000, media_dir=media_dir).start()
+    try:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", server.url, json.dumps(params)],
+            capture_output=True, text=True,
+        )
+        if child.returncode:
+            raise RuntimeError(f"{name} failed:\n{child.stderr}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        result["requests"] = dict(server.requests)
+        return result
+    finally:
+        server.stop()
+        if media_dir:
+            shutil.rmtree(media_dir, ignore_errors=True)
+
+
+def compare(results, baseline):
+    print(f"\n{'scenario':<16} {'cards/s':>10} {'baseline':>10} {'change':>8} {'rss MB':>8} {'baseline':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        change = (result["cards_per_second"] / base["cards_per_second"] - 1) * 100
+        print(f"{name:<16} {result['cards_per_second']:>10.0f} {base['cards_per_second']:>10.0f} {change:>+7.1f}%"
+              f" {result['peak_rss_mb'] or 0:>8.0f} {base['peak_rss_mb'] or 0:>9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark export_to_html_gui against a synthetic AnkiConnect.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--cards", type=int, help="override the card count of every scenario")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override any scenario parameter, e.g. --set latency_ms=50")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --output")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_export(args.child[0], json.loads(args.child[1]))))
+        return
+
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key] = json.loads(value)
+    if args.cards:
+        overrides["cards"] = args.cards
+
+    results = {}
+    print(f"{'scenario':<16} {'cards':>7} {'seconds':>8} {'cards/s':>9} {'media MB/s':>11} {'first ms':>9}"
+          f" {'rss MB':>7} {'cards_info p95':>15} {'html MB':>8} {'requests':>9} {'files':>7} {'out MB':>7}")
+    for name in args.scenarios or SCENARIOS:
+        result = results[name] = run_scenario(name, {**SCENARIOS[name], **overrides})
+        cards_info = result["latency_ms"].get("cards_info", {}).get("p95")
+        print(f"{name:<16} {result['cards']:>7} {result['seconds']:>8.2f} {result['cards_per_second']:>9.0f}"
+              f" {result['media_mb_per_second']:>11.1f} {result['first_card_ms'] or 0:>9.0f}"
+              f" {result['peak_rss_mb'] or 0:>7.0f} {cards_info or 0:>15.1f} {result['html_mb']:>8.1f}"
+              f" {sum(result['requests'].values()):>9} {result['output_files']:>7} {result['output_mb']:>7.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
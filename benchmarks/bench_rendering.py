@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import timeit
+import urllib.parse
+import html
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from headless import load_addon_module
+
+rendering = load_addon_module("rendering")
+
+
+def legacy_render_card(card, media_map):
+    # The per-card loop exporter.py used before rendering.py existed
+    answer = card.get("answer", "")
+    answer = re.sub(r'<div id="tags-container".*?>.*?</div>', '', answer, flags=re.DOTALL | re.IGNORECASE)
+    fields = card.get("fields", {})
+    tags = card.get("tags", [])
+
+    for media_file in re.findall(r'src=["\']([^"\']+)["\']', answer):
+        local_path = media_map.get(media_file)
+        if local_path:
+            answer = answer.replace(media_file, local_path)
+
+    parts = ["<div class='card'>"]
+    parts.append(f"<a href='#{card['cardId']}' class='card-id' id='{card['cardId']}'>Card ID: {card['cardId']}</a>")
+    parts.append(f"<div>{answer}</div>")
+    for field_name, content in fields.items():
+        val = content.get("value", "").strip()
+        if not val or val in answer or field_name.lower() in ["front", "question"]:
+            continue
+        for media_file in re.findall(r'src=["\']([^"\']+)["\']', val):
+            local_path = media_map.get(media_file)
+            if local_path:
+                val = val.replace(media_file, local_path)
+        parts.append(f"<button data-content='{urllib.parse.quote(val)}'>{html.escape(field_name)}</button>")
+    if tags:
+        parts.append(f"<p class='tags'>Tags: {', '.join(tags)}</p>")
+    parts.append("</div>")
+    return "".join(parts)
+
+
+def make_card(card_id, images, fields, text_size):
+    filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (text_size // 56 + 1)
+    imgs = "".join(f'<p>{filler[:200]}</p><img src="image_{card_id}_{i}.png">' for i in range(images))
+    return {
+        "cardId": card_id,
+        "answer": f"<div>Question {card_id}</div><hr id=answer>{filler[:text_size]}{imgs}"
+                  '<div id="tags-container">tag_a tag_b</div>',
+        "fields": {
+            f"Field{i}": {"value": f"{filler[:text_size // fields]}<img src='field_{card_id}_{i}.jpg'>", "order": i}
+            for i in range(fields)
+        },
+        "tags": ["tag_a", "tag_b"],
+    }
+
+
+SCENARIOS = [
+    ("text only", dict(images=0, fields=4, text_size=2000)),
+    ("10 images", dict(images=10, fields=6, text_size=4000)),
+    ("50 images", dict(images=50, fields=8, text_size=20000)),
+    ("200 images", dict(images=200, fields=12, text_size=80000)),
+]
+
+
+def run(cards_per_scenario=200, repeat=5):
+    print(f"{'scenario':<12} {'legacy ms/card':>15} {'rendering ms/card':>18} {'speedup':>8}")
+    for label, params in SCENARIOS:
+        cards = [make_card(i, **params) for i in range(cards_per_scenario)]
+        media_map = {}
+        for card in cards:
+            for name in rendering.card_media_filenames(card):
+                media_map[name] = f"media/{name}"
+
+        legacy = min(timeit.repeat(lambda: [legacy_render_card(c, media_map) for c in cards], number=1, repeat=repeat))
+        current = min(timeit.repeat(lambda: [rendering.render_card(c, media_map)[0] for c in cards], number=1, repeat=repeat))
+        legacy_ms = legacy * 1000 / len(cards)
+        current_ms = current * 1000 / len(cards)
+        print(f"{label:<12} {legacy_ms:>15.3f} {current_ms:>18.3f} {legacy / current:>7.2f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,71 @@
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from headless import load_addon_module
+
+tag_index = load_addon_module("tag_index")
+
+
+def make_tags(count, seed=1):
+    rng = random.Random(seed)
+    words = [f"{rng.choice('BCDFGHKLMNPRST')}{''.join(rng.choice('aeiou') + rng.choice('lmnrst') for _ in range(3))}"
+             for _ in range(400)]
+    tags = set()
+    while len(tags) < count:
+        depth = rng.randint(1, 4)
+        tags.add("::".join(rng.choice(words[:20] if level == 0 else words) for level in range(depth)))
+    return sorted(tags)
+
+
+def keystrokes(tags, sessions, seed=2):
+    # Every prefix of a handful of real tags, as typed one character at a time
+    rng = random.Random(seed)
+    for tag in rng.sample(tags, sessions):
+        for end in range(1, len(tag) + 1):
+            yield tag[:end]
+
+
+def linear_complete(tags, text, limit=50):
+    # What a plain QCompleter over the full list does per keystroke
+    prefix = text.casefold()
+    return [tag for tag in tags if tag.casefold().startswith(prefix)][:limit]
+
+
+def measure(complete, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        complete(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1], timings[-1]
+
+
+def run(tag_count=120_000, sessions=30):
+    tags = make_tags(tag_count)
+    queries = list(keystrokes(tags, sessions))
+
+    start = time.perf_counter()
+    index = tag_index.TagIndex(tags)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    cache = tag_index.TagIndexCache()
+    cache.get(1, lambda: tags)
+    start = time.perf_counter()
+    cache.get(1, lambda: tags)
+    reopen_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{len(tags)} tags, {len(queries)} keystrokes")
+    print(f"index build: {build_ms:.1f} ms, cached reopen: {reopen_ms:.3f} ms")
+    print(f"{'completer':<12} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for label, complete in (("linear", lambda q: linear_complete(tags, q)), ("TagIndex", index.complete)):
+        p50, p99, worst = measure(complete, queries)
+        print(f"{label:<12} {p50:>9.3f} {p99:>9.3f} {worst:>9.3f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,257 @@
+import base64
+import io
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+WORDS = ("alpha", "beta", "gamma", "delta", "kinase", "receptor", "ligand", "axon", "nephron", "alveolus",
+         "mitosis", "enzyme", "hormone", "cortex", "plasma", "vector", "matrix", "theorem", "lemma", "proof")
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "xe", "zu", "bra", "cel", "dor", "fen", "gis", "hal",
+             "jun", "kor", "lum", "mar", "nox", "pel", "quin", "ros", "sul", "tav", "ulm", "ver", "wyn", "yth")
+
+
+class FakeCollection:
+    # Cards, notes and media are derived from the card number and seed, so the
+    # same parameters always produce the same collection without holding it in memory.
+    def __init__(self, cards=1000, fields=4, media=100, media_size=20_000, external_share=0.0,
+                 media_per_card=2, text_size=400, cards_per_note=1, vocabulary=0, image_dimension=0, seed=1):
+        self.card_count = cards
+        self.cards_per_note = cards_per_note
+        self.field_count = max(2, fields)
+        self.media_count = media
+        self.media_size = media_size
+        self.external_count = int(media * external_share)
+        self.media_per_card = media_per_card if media else 0
+        self.text_size = text_size
+        self.seed = seed
+        self.base_url = ""
+        self._media_cache = {}
+        # Real JPEG photos of this size instead of random bytes behind a PNG header
+        self.image_dimension = image_dimension
+        self.media_extension = ".jpg" if image_dimension else ".png"
+        self._noise = None
+        if image_dimension and Image is None:
+            raise RuntimeError("image_dimension needs Pillow")
+        self.words = list(WORDS)
+        self._cum_weights = None
+        if vocabulary > len(WORDS):
+            # Made-up words drawn with Zipf weights, like the long tail of a real collection
+            rng = random.Random(seed)
+            words = dict.fromkeys(WORDS)
+            while len(words) < vocabulary:
+                words["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))] = None
+            self.words = list(words)
+            self._cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(self.words) + 1)))
+
+    def card_ids(self):
+        return list(range(1, self.card_count + 1))
+
+    def note_id(self, card_id):
+        return 1_000_000 + (card_id - 1) // self.cards_per_note
+
+    def note_ids(self):
+        return list(range(self.note_id(1), self.note_id(self.card_count) + 1))
+
+    def note_card_ids(self, note_id):
+        first = (note_id - 1_000_000) * self.cards_per_note + 1
+        return list(range(first, min(first + self.cards_per_note, self.card_count + 1)))
+
+    def media_name(self, index):
+        if index < self.external_count:
+            return f"{self.base_url}/ext/remote_{index}{self.media_extension}"
+        return f"media_{index}{self.media_extension}"
+
+    def media_bytes(self, index):
+        data = self._media_cache.get(index)
+        if data is None and self.image_dimension:
+            return self.photo_bytes(index)
+        if data is None:
+            rng = random.Random(self.seed * 1_000_003 + index)
+            data = PNG_HEADER + rng.randbytes(max(0, self.media_size - len(PNG_HEADER)))
+            if len(self._media_cache) < 1024:
+                self._media_cache[index] = data
+        return data
+
+    def photo_bytes(self, index):
+        # One 3:2 noise image per collection; a marker per index gives every photo its own content
+        if self._noise is None:
+            width = self.image_dimension
+            self._noise = Image.effect_noise((width, width * 2 // 3), 40).convert("RGB")
+        image = self._noise.copy()
+        ImageDraw.Draw(image).rectangle((0, 0, 64, 64), fill=(index * 37 % 256, index * 101 % 256, index // 256 * 53 % 256))
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=90)
+        return out.getvalue()
+
+    def media_index(self, name):
+        name = name.rsplit("/", 1)[-1]
+        for prefix in ("media_", "remote_"):
+            if name.startswith(prefix) and name.endswith(self.media_extension):
+                return int(name[len(prefix):-len(self.media_extension)])
+        return None
+
+    def text(self, rng, size):
+        if self._cum_weights:
+            words = rng.choices(self.words, cum_weights=self._cum_weights, k=max(1, size // 8))
+            return " ".join(words)
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    def note(self, note_id):
+        # Siblings share the fields, media and tags of their note
+        rng = random.Random(self.seed * 1_000_003 + note_id)
+        media = [self.media_name((note_id * 7 + i * 13) % self.media_count) for i in range(self.media_per_card)]
+        fields = {"Front": {"value": self.text(rng, 40), "order": 0}}
+        for order in range(1, self.field_count):
+            value = self.text(rng, self.text_size // self.field_count)
+            if order - 1 < len(media) - 1:
+                value += f"<img src='{media[order]}'>"
+            fields[f"Field{order}"] = {"value": value, "order": order}
+        return {
+            "noteId": note_id,
+            "mod": 1_700_000_000,
+            "fields": fields,
+            "tags": ["bench", f"group_{note_id % 10}"],
+            "cards": self.note_card_ids(note_id),
+            "media": media,
+        }
+
+    def card(self, card_id):
+        note = self.note(self.note_id(card_id))
+        fields = note["fields"]
+        images = "".join(f'<img src="{name}">' for name in note["media"][:1])
+        ordinal = card_id - note["cards"][0] + 1
+        answer = (f"<div>{fields['Front']['value']} ({ordinal})</div><hr id=answer>{fields['Field1']['value']}{images}"
+                  f'<div id="tags-container">bench</div>')
+        return {
+            "cardId": card_id,
+            "note": note["noteId"],
+            "deckName": "Bench",
+            "mod": 1_700_000_000,
+            "answer": answer,
+            "fields": fields,
+            "tags": note["tags"],
+        }
+
+    def write_media_dir(self, path):
+        os.makedirs(path, exist_ok=True)
+        for index in range(self.external_count, self.media_count):
+            with open(os.path.join(path, self.media_name(index)), "wb") as f:
+                f.write(self.media_bytes(index))
+
+
+class FakeAnkiConnect:
+    def __init__(self, collection, latency=0.0, media_dir=None, host="127.0.0.1", port=0):
+        self.collection = collection
+        self.latency = latency
+        self.media_dir = media_dir
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+        collection.base_url = self.url
+        self._thread = None
+
+    def handle(self, action, params):
+        with self._lock:
+            self.requests[action] += 1
+        if action == "multi":
+            return [{"result": self.handle(inner["action"], inner.get("params", {})), "error": None}
+                    for inner in params["actions"]]
+        if action == "version":
+            return 6
+        if action == "findCards":
+            if params["query"].startswith("nid:"):
+                note_ids = map(int, params["query"][4:].split(","))
+                return [card_id for note_id in note_ids for card_id in self.collection.note_card_ids(note_id)]
+            return self.collection.card_ids()
+        if action == "cardsInfo":
+            return [self.collection.card(card_id) for card_id in params["cards"]]
+        if action == "findNotes":
+            return self.collection.note_ids()
+        if action == "notesInfo":
+            notes = []
+            for note_id in params["notes"]:
+                note = self.collection.note(note_id)
+                del note["media"]
+                notes.append(note)
+            return notes
+        if action == "notesModTime":
+            return [{"noteId": note_id, "mod": 1_700_000_000} for note_id in params["notes"]]
+        if action == "getMediaDirPath":
+            return self.media_dir
+        if action == "retrieveMediaFile":
+            index = self.collection.media_index(params["filename"])
+            if index is None:
+                return False
+            return base64.b64encode(self.collection.media_bytes(index)).decode("ascii")
+        raise ValueError(f"unsupported action {action}")
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, every
+            # keep-alive reply would wait for the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                try:
+                    reply = {"result": server.handle(request["action"], request.get("params", {})), "error": None}
+                except Exception as e:
+                    reply = {"result": None, "error": str(e)}
+                self._send(200, json.dumps(reply).encode("utf-8"), "application/json")
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests["GET"] += 1
+                index = server.collection.media_index(urllib.parse.urlsplit(self.path).path)
+                if index is None or not self.path.startswith("/ext/"):
+                    self._send(404, b"", "text/plain")
+                    return
+                self._send(200, server.collection.media_bytes(index), "image/png")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
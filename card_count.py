@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+from aqt import mw
+from aqt.qt import QObject, QTimer, pyqtSignal
+
+
+class CardCountCache:
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, count):
+        self._entries[key] = count
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Shared across dialog openings; keys include the collection mod time so edits invalidate them
+count_cache = CardCountCache()
+
+
+class CardCounter(QObject):
+    counted = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    started = pyqtSignal()
+
+    def __init__(self, parent=None, delay_ms=250, cache=count_cache):
+        super().__init__(parent)
+        self.cache = cache
+        self._query = ""
+        self._generation = 0
+        self._running = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._start)
+
+    def request(self, query):
+        self._query = query
+        self._generation += 1
+        if not query:
+            self._timer.stop()
+            self.counted.emit(0)
+            return
+        cached = self.cache.get((query, mw.col.mod))
+        if cached is not None:
+            self._timer.stop()
+            self.counted.emit(cached)
+            return
+        self.started.emit()
+        # Restarting the timer drops any query that was still waiting to run
+        self._timer.start()
+
+    def _start(self):
+        if self._running:
+            # The running query's completion starts the newest one
+            return
+        generation = self._generation
+        query = self._query
+        key = (query, mw.col.mod)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.counted.emit(cached)
+            return
+        self._running = True
+        mw.taskman.run_in_background(
+            lambda: len(mw.col.find_cards(query)),
+            lambda future: self._done(future, generation, key),
+        )
+
+    def _done(self, future, generation, key):
+        self._running = False
+        try:
+            count = future.result()
+        except Exception as e:
+            if generation == self._generation:
+                self.failed.emit(str(e))
+            return
+        self.cache.put(key, count)
+        if generation == self._generation:
+            self.counted.emit(count)
+        elif self._query and not self._timer.isActive():
+            self._start()
@@ -0,0 +1,127 @@
+import errno
+import json
+import os
+import shutil
+
+JOURNAL_NAME = "export_journal.jsonl"
+JOURNAL_VERSION = 1
+EXPORT_FILES = ("index.html", "card-index.js", "css", "media", "fields", "search", "export_manifest.json",
+                "export_report.json")
+
+
+def staging_path(output_base):
+    parent, name = os.path.split(os.path.abspath(output_base))
+    return os.path.join(parent, f".{name}.partial")
+
+
+def is_export_file(name):
+    return name in EXPORT_FILES or (name.startswith("page-") and name.endswith(".html"))
+
+
+def remove_export_files(folder):
+    # Only entries an export writes are removed; a folder left with anything else is kept
+    for name in os.listdir(folder):
+        if is_export_file(name) or name in (JOURNAL_NAME, "export_manifest.json.tmp"):
+            path = os.path.join(folder, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+    try:
+        os.rmdir(folder)
+    except OSError:
+        return False
+    return True
+
+
+def reset_staging(staging):
+    if os.path.isdir(staging):
+        remove_export_files(staging)
+    os.makedirs(staging, exist_ok=True)
+
+
+def finalize_staging(staging, output_base):
+    # The finished export replaces the previous one with two renames on the same
+    # filesystem, so a reader never finds a partial export in output_base. Files
+    # the exporter did not write move across only once both renames succeeded, and
+    # the journal goes last, so a failure leaves the export resumable.
+    output_base = os.path.abspath(output_base)
+    if not os.path.isdir(output_base):
+        os.rename(staging, output_base)
+        os.unlink(os.path.join(output_base, JOURNAL_NAME))
+        return
+    parent, name = os.path.split(output_base)
+    previous = os.path.join(parent, f".{name}.previous")
+    if os.path.isdir(previous) and not remove_export_files(previous):
+        raise OSError(errno.EEXIST, f"{previous} holds files from an earlier export; move them out and export again")
+    os.rename(output_base, previous)
+    try:
+        os.rename(staging, output_base)
+    except OSError:
+        os.rename(previous, output_base)
+        raise
+    for name in os.listdir(previous):
+        # Anything the exporter did not write itself stays with the folder
+        if not is_export_file(name) and not os.path.lexists(os.path.join(output_base, name)):
+            os.replace(os.path.join(previous, name), os.path.join(output_base, name))
+    os.unlink(os.path.join(output_base, JOURNAL_NAME))
+    if not remove_export_files(previous):
+        print(f"Some files could not be moved back into {output_base}; they were left in {previous}")
+
+
+class ExportJournal:
+    # Append-only JSON lines in the staging folder: a header naming the export,
+    # then one checkpoint per written batch of cards with their page locations
+    # and the media placed so far. A torn last line is ignored on resume.
+    def __init__(self, staging, header, cards=None, media=None):
+        self.path = os.path.join(staging, JOURNAL_NAME)
+        self.header = dict(header, version=JOURNAL_VERSION)
+        self.cards = cards or {}
+        self.media = media or {}
+        self._file = None
+        self._valid_length = None
+
+    @classmethod
+    def load(cls, staging, header):
+        journal = cls(staging, header)
+        try:
+            with open(journal.path, "rb") as f:
+                lines = f.read().split(b"\n")
+            if json.loads(lines[0]) != journal.header:
+                return None
+        except (OSError, ValueError):
+            return None
+        length = len(lines[0]) + 1
+        for line in lines[1:-1]:
+            try:
+                checkpoint = json.loads(line)
+            except ValueError:
+                break
+            journal.cards.update(checkpoint["cards"])
+            journal.media.update(checkpoint["media"])
+            length += len(line) + 1
+        journal._valid_length = length
+        return journal
+
+    def open(self):
+        if self._valid_length is not None:
+            # Continue after the last complete checkpoint
+            with open(self.path, "r+b") as f:
+                f.truncate(self._valid_length)
+            self._file = open(self.path, "a", encoding="utf-8")
+            return
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(json.dumps(self.header) + "\n")
+
+    def checkpoint(self, cards, media):
+        if not cards and not media:
+            return
+        self._file.write(json.dumps({"cards": cards, "media": media}, ensure_ascii=False, separators=(",", ":")))
+        self._file.write("\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
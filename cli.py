@@ -0,0 +1,68 @@
+import argparse
+import json
+import sys
+import time
+
+from headless import load_addon_module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a batch of HTML exports against AnkiConnect without the Anki GUI.")
+    parser.add_argument("jobs", help="JSON job file: {\"defaults\": {...}, \"jobs\": [{\"deck\", \"tags\", \"note_ids\", \"output\", ...}]}")
+    parser.add_argument("--parallel", type=int, default=2, help="number of exports running at once")
+    parser.add_argument("--url", default=None, help="AnkiConnect URL (default http://localhost:8765)")
+    parser.add_argument("--summary", default=None, help="write all job summaries to this JSON file")
+    parser.add_argument("--media-cache", default=None, help="shared media cache folder")
+    parser.add_argument("--media-cache-mb", type=int, default=2048, help="media cache size budget in MB")
+    parser.add_argument("--max-image-size", type=int, default=0,
+                        help="downscale images to this many pixels on their longest side (needs Pillow)")
+    parser.add_argument("--image-quality", type=int, default=80, help="encoder quality of downscaled images")
+    parser.add_argument("--image-format", choices=("webp", "jpeg"), default="webp", help="format of downscaled images")
+    parser.add_argument("--image-cache", default=None, help="cache folder of downscaled images")
+    args = parser.parse_args(argv)
+
+    anki_client = load_addon_module("anki_client")
+    batch = load_addon_module("batch")
+    images = load_addon_module("images")
+    media_cache = load_addon_module("media_cache")
+    sources = load_addon_module("sources")
+
+    jobs = batch.load_jobs(args.jobs)
+    client = anki_client.AnkiConnectClient(
+        url=args.url or anki_client.ANKI_CONNECT_URL, pool_size=max(4, args.parallel * 2)
+    )
+    cache = None
+    if args.media_cache:
+        cache = media_cache.MediaCache(args.media_cache, max_bytes=args.media_cache_mb * 1024 * 1024)
+
+    image_processor = None
+    if args.max_image_size:
+        image_processor = images.ImageProcessor(args.max_image_size, args.image_quality, args.image_format,
+                                                cache_dir=args.image_cache)
+
+    scheduler = batch.BatchScheduler(args.parallel, sources.AnkiConnectSource(client), media_cache=cache,
+                                     image_processor=image_processor)
+    started = time.perf_counter()
+
+    def report(summary):
+        print(f"[{summary['status']}] {summary['name']}: {summary['cards']} cards in {summary['seconds']}s")
+
+    try:
+        summaries = scheduler.run(jobs, on_job_done=report)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        raise
+    finally:
+        scheduler.close()
+
+    elapsed = time.perf_counter() - started
+    failed = [summary for summary in summaries if summary["status"] == "failed"]
+    print(f"{len(summaries)} jobs, {len(failed)} failed, {sum(s['cards'] for s in summaries)} cards in {elapsed:.1f}s")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump({"seconds": round(elapsed, 3), "jobs": summaries}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
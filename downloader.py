@@ -0,0 +1,162 @@
+import hashlib
+import http.client
+import os
+import re
+import threading
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .media import materialize_file
+
+MAX_REDIRECTS = 5
+# Downloads get their own folder so they can never take the name of a collection file
+EXTERNAL_FOLDER = "external"
+
+
+def safe_media_name(url):
+    return re.sub(r'[^a-zA-Z0-9_.-]', '_', os.path.basename(urllib.parse.urlsplit(url).path) or "download")
+
+
+class ExternalDownloader:
+    def __init__(self, max_workers=8, per_host=2, timeout=10, cache=None, download_dir=None):
+        self.timeout = timeout
+        self.cache = cache
+        # Shared between exports, files land in download_dir and are linked into each media folder
+        self.download_dir = download_dir
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media-download")
+        self._lock = threading.Lock()
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._futures = {}
+        self._names = {}
+        self._local = threading.local()
+        self._connections = []
+
+    def submit(self, url, media_dir):
+        with self._lock:
+            future = self._futures.get(url)
+            if future is None:
+                name = self._claim_name(url)
+                folder = self.download_dir or os.path.join(media_dir, EXTERNAL_FOLDER)
+                future = self._executor.submit(self._download, url, os.path.join(folder, name))
+                self._futures[url] = future
+            return future
+
+    def result(self, url, media_dir, archive=None):
+        future = self._futures.get(url)
+        if future is None or future.cancelled():
+            return None
+        path = future.result()
+        if not path:
+            return None
+        name = f"media/{EXTERNAL_FOLDER}/{os.path.basename(path)}"
+        if archive:
+            try:
+                archive.write_file(name, path)
+            except OSError as e:
+                print(f"Failed to place downloaded file: {url} → {e}")
+                return None
+            return name
+        local_path = os.path.join(media_dir, EXTERNAL_FOLDER, os.path.basename(path))
+        if os.path.abspath(path) != os.path.abspath(local_path) and not os.path.exists(local_path):
+            try:
+                materialize_file(path, local_path)
+            except OSError as e:
+                print(f"Failed to place downloaded file: {url} → {e}")
+                return None
+        return name
+
+    def downloaded_path(self, url):
+        # Where a finished download sits, for readers that need the file itself
+        future = self._futures.get(url)
+        if future is None or not future.done() or future.cancelled():
+            return None
+        return future.result()
+
+    def _claim_name(self, url):
+        # Different URLs sharing a basename must not overwrite each other
+        name = safe_media_name(url)
+        owner = self._names.setdefault(name, url)
+        if owner != url:
+            name = f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}_{name}"
+            self._names[name] = url
+        return name
+
+    def _host_slot(self, netloc):
+        with self._lock:
+            return self._host_slots[netloc]
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = conn_class(netloc, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn:
+            conn.close()
+
+    def _get(self, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            with self._host_slot(parts.netloc):
+                for attempt in range(2):
+                    conn = self._connection(parts.scheme, parts.netloc)
+                    try:
+                        conn.request("GET", path, headers={"User-Agent": "anki-html-exporter"})
+                        response = conn.getresponse()
+                        body = response.read()
+                        break
+                    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                        # Stale keep-alive connection, retry once on a fresh one
+                        self._drop_connection(parts.scheme, parts.netloc)
+                        if attempt:
+                            raise
+                    except Exception:
+                        self._drop_connection(parts.scheme, parts.netloc)
+                        raise
+                if response.will_close:
+                    self._drop_connection(parts.scheme, parts.netloc)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                continue
+            return response.status, body
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def _download(self, url, local_path):
+        cache_key = self.cache.key_for("url", url) if self.cache else None
+        if cache_key and self.cache.fetch(cache_key, local_path):
+            return local_path
+        try:
+            status, data = self._get(url)
+            if status != 200:
+                print(f"HTTP Error {status} for URL {url}")
+                return None
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            # Replaced rather than rewritten: the old file may be a hardlink to a cached copy
+            tmp_path = f"{local_path}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, local_path)
+            if cache_key:
+                self.cache.store(cache_key, local_path)
+            return local_path
+        except Exception as e:
+            print(f"Failed to download external file: {url} → {e}")
+            return None
+
+    def close(self, cancel=False):
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -10,6 +10,7 @@ from importlib import import_module
 # Import the exporter from the main add-on
 exporter_module = import_module("search_to_html.exporter")
 export_to_html_gui = exporter_module.export_to_html_gui
+format_progress = import_module("search_to_html.progress").format_progress
 
 def generate_folder_name(deck, tags):
     parts = ["Anki_Export"]
@@ -47,7 +48,7 @@ def run_export_test():
             deck_name=deck,
             tags=selected_tags,
             output_base=full_path,
-            progress_callback=lambda c, t: print(f"🔄 Progress: {c}/{t}"),
+            progress_callback=lambda progress: print(f"🔄 Progress: {format_progress(progress)}"),
             stop_flag=lambda: False,
         )
 
@@ -1,81 +1,181 @@
 import os
-import re
-import base64
-import imghdr
-import html
-import urllib.parse
-import urllib.request
-import json
-from aqt import mw
-
-ANKI_CONNECT_URL = "http://localhost:8765"
-
-def anki_request(action, params=None):
-    payload = json.dumps({
-        "action": action,
-        "version": 6,
-        "params": params or {}
-    }).encode('utf-8')
-
-    req = urllib.request.Request(
-        ANKI_CONNECT_URL,
-        data=payload,
-        headers={'Content-Type': 'application/json'}
-    )
+import shutil
+import tempfile
 
-    try:
-        with urllib.request.urlopen(req) as response:
-            if response.status != 200:
-                print(f"HTTP Error {response.status}")
-                return []
-            response_data = response.read().decode('utf-8')
-            result = json.loads(response_data)
-            if "error" in result and result["error"]:
-                print("AnkiConnect error:", result["error"])
-                return []
-            return result["result"]
-    except Exception as e:
-        print("Exception in anki_request:", e)
-        return []
-
-def extract_media_filenames(html_content):
-    return re.findall(r'src=["\']([^"\']+)["\']', html_content)
-
-def is_external_url(url):
-    return url.startswith("http://") or url.startswith("https://")
-
-def download_media_file(filename, media_dir):
-    if is_external_url(filename):
-        try:
-            with urllib.request.urlopen(filename, timeout=10) as response:
-                if response.status != 200:
-                    print(f"HTTP Error {response.status} for URL {filename}")
-                    return None
-                data = response.read()
-                safe_name = re.sub(r'[^a-zA-Z0-9_.-]', '_', os.path.basename(filename))
-                local_path = os.path.join(media_dir, safe_name)
-                os.makedirs(media_dir, exist_ok=True)
-                with open(local_path, 'wb') as f:
-                    f.write(data)
-                return f"media/{safe_name}"
-        except Exception as e:
-            print(f"Failed to download external file: {filename} → {e}")
+from .archive import ExportArchive, archive_path, write_viewer
+from .checkpoint import ExportJournal, finalize_staging, reset_staging, staging_path
+from .downloader import ExternalDownloader
+from .html_output import STYLES_CSS, FieldStore, ShardedWriter, SingleFileWriter
+from .images import SCALABLE_EXTENSIONS, SCALED_FOLDER, image_source, is_image_path
+from .incremental import ExportManifest, hash_bytes
+from .instrumentation import ExportStats
+from .media import (detect_media_type, is_safe_media_name, materialize_file, sniff_media_type, write_media_bytes,
+                    HEADER_SIZE)
+from .progress import ProgressReporter
+from .render_pool import RenderPool
+from .rendering import card_media_filenames, collect_media_filenames, is_external_url
+from .search_index import SearchIndex
+from .sources import default_source
+
+MEDIA_BATCH_SIZE = 50
+CARD_PAGE_SIZE = 500
+NOTE_ID_CHUNK_SIZE = 1000
+
+def save_media_file(filename, binary_data, media_dir, archive=None):
+    if not is_safe_media_name(filename):
         return None
+    if binary_data and sniff_media_type(binary_data[:HEADER_SIZE]):
+        if archive:
+            archive.write_bytes(f"media/{filename}", binary_data)
+        else:
+            write_media_bytes(binary_data, os.path.join(media_dir, filename))
+        return f"media/{filename}"
+    return None
 
-    media_data = anki_request("retrieveMediaFile", {"filename": filename})
-    if media_data:
-        binary_data = base64.b64decode(media_data)
-        image_format = imghdr.what(None, binary_data)
-        if image_format:
-            os.makedirs(media_dir, exist_ok=True)
-            path = os.path.join(media_dir, filename)
-            with open(path, "wb") as f:
-                f.write(binary_data)
-            return f"media/{filename}"
+def copy_media_file(filename, src_path, media_dir, media_mode="auto", archive=None):
+    if not is_safe_media_name(filename):
+        return None
+    if detect_media_type(src_path):
+        if archive:
+            archive.write_file(f"media/{filename}", src_path)
+        else:
+            materialize_file(src_path, os.path.join(media_dir, filename), media_mode)
+        return f"media/{filename}"
     return None
 
-def get_card_info(card_ids):
-    return anki_request("cardsInfo", {"cards": card_ids})
+def fetch_cached_media(cache, key, filename, media_dir, archive=None):
+    # Returns the path of the placed file, or of the cached object when it went into the archive
+    if not archive:
+        dest = os.path.join(media_dir, filename)
+        return dest if cache.fetch(key, dest) else None
+    path = cache.lookup(key)
+    if path:
+        archive.write_file(f"media/{filename}", path)
+    return path
+
+def fetch_media_files(filenames, media_dir, source, batch_size=MEDIA_BATCH_SIZE, media_mode="auto", downloader=None,
+                      manifest=None, cache=None, stats=None, archive=None, originals=None):
+    # originals, when given, collects a readable path or the bytes of each placed file
+    stats = stats or ExportStats()
+    originals = {} if originals is None else originals
+    namespace = source.media_namespace() if cache else None
+
+    def cache_key(filename):
+        return cache.key_for(namespace, filename)
+
+    media_map = {}
+    remote_files = []
+    for filename in filenames:
+        if not is_external_url(filename) and not is_safe_media_name(filename):
+            print(f"Skipping media outside the media folder: {filename}")
+            continue
+        if is_external_url(filename):
+            if manifest and manifest.unchanged_media(filename):
+                media_map[filename] = manifest.media[filename]["path"]
+                stats.count("media_reused")
+                continue
+            # Resolved later through downloader.result() while other work continues
+            downloader.submit(filename, media_dir)
+            continue
+        src_path = source.media_path(filename)
+        if not src_path:
+            if manifest and manifest.unchanged_media(filename):
+                media_map[filename] = manifest.media[filename]["path"]
+                stats.count("media_reused")
+                continue
+            cached = fetch_cached_media(cache, cache_key(filename), filename, media_dir, archive) if cache else None
+            if cached:
+                media_map[filename] = f"media/{filename}"
+                originals[filename] = cached
+                if manifest:
+                    manifest.record_media(filename, media_map[filename])
+            else:
+                remote_files.append(filename)
+            continue
+        if manifest and manifest.unchanged_media(filename, src_path):
+            media_map[filename] = manifest.media[filename]["path"]
+            stats.count("media_reused")
+            continue
+        try:
+            with stats.stage("media_copy"):
+                local_path = copy_media_file(filename, src_path, media_dir, media_mode, archive)
+        except OSError as e:
+            print(f"Failed to copy media file: {filename} → {e}")
+            continue
+        if local_path:
+            media_map[filename] = local_path
+            originals[filename] = src_path
+            stats.count("media_copied")
+            stats.count("media_bytes", os.path.getsize(src_path))
+            if manifest:
+                manifest.record_media(filename, local_path, src_path=src_path)
+
+    for start in range(0, len(remote_files), batch_size):
+        batch = remote_files[start:start + batch_size]
+        with stats.stage("media_retrieve"):
+            retrieved = source.retrieve_media(batch)
+        for filename, media_data in retrieved.items():
+            with stats.stage("media_write"):
+                local_path = save_media_file(filename, media_data, media_dir, archive)
+            if local_path:
+                media_map[filename] = local_path
+                originals[filename] = media_data
+                stats.count("media_retrieved")
+                stats.count("media_bytes", len(media_data))
+                if cache and archive:
+                    cache.store_bytes(cache_key(filename), media_data)
+                elif cache:
+                    cache.store(cache_key(filename), os.path.join(media_dir, filename))
+                if manifest:
+                    manifest.record_media(filename, local_path, data=media_data)
+    return media_map
+
+def ensure_note_mod_times(cards, source):
+    missing = {card["note"] for card in cards if "noteMod" not in card}
+    if missing:
+        note_mods = source.note_mod_times(list(missing))
+        for card in cards:
+            card.setdefault("noteMod", note_mods.get(card["note"]))
+
+def iter_card_pages(card_ids, source, page_size=CARD_PAGE_SIZE):
+    for start in range(0, len(card_ids), page_size):
+        yield source.cards_info(card_ids[start:start + page_size])
+
+def note_unit(note, cards):
+    # A note travels through the pipeline like a card: cardId is the unit id and
+    # mod changes whenever one of its exported cards changes.
+    versions = ",".join(f"{card['cardId']}:{card.get('mod')}" for card in cards)
+    unit = {
+        "cardId": f"n{note['noteId']}",
+        "note": note["noteId"],
+        "mod": hash_bytes(versions.encode("ascii")),
+        "fields": note.get("fields", {}),
+        "tags": note.get("tags", []),
+        "cards": [{"cardId": card["cardId"], "answer": card.get("answer", "")} for card in cards],
+    }
+    if note.get("mod") is not None:
+        unit["noteMod"] = note["mod"]
+    return unit
+
+def iter_note_pages(note_ids, card_ids, source, page_size=CARD_PAGE_SIZE):
+    # Fields and tags come once per note from notesInfo; cardsInfo is only asked
+    # for the note's cards that matched the search.
+    wanted = set(card_ids)
+    start = 0
+    notes_per_page = page_size
+    while start < len(note_ids):
+        batch = note_ids[start:start + notes_per_page]
+        start += len(batch)
+        notes = [note for note in source.notes_info(batch) if note.get("noteId")]
+        page_cards = [card_id for note in notes for card_id in note["cards"] if card_id in wanted]
+        cards = {card["cardId"]: card for card in source.cards_info(page_cards)}
+        yield [
+            note_unit(note, [cards[card_id] for card_id in note["cards"] if card_id in cards])
+            for note in notes
+        ]
+        # Keep cardsInfo requests near page_size cards however many siblings a note has
+        if page_cards:
+            notes_per_page = max(1, page_size * len(notes) // len(page_cards))
 
 def build_query(deck_name, tags):
     parts = []
@@ -85,122 +185,436 @@ def build_query(deck_name, tags):
         parts.extend([f'tag:"{tag}"' for tag in tags])  
     return " ".join(parts)
 
-def export_to_html_gui(deck_name=None, tags=None, note_ids=None, output_base=None, progress_callback=None, stop_flag=None):
-    print("Starting export_to_html_gui()")
+def write_if_changed(path, content):
+    data = content.encode("utf-8")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+def find_note_card_ids(source, note_ids, chunk_size=NOTE_ID_CHUNK_SIZE):
+    # Bounded "nid:1,2,3" queries; one query for a large selection gets too long to parse
+    card_ids = []
+    for start in range(0, len(note_ids), chunk_size):
+        chunk = note_ids[start:start + chunk_size]
+        card_ids.extend(source.find_cards(f"nid:{','.join(map(str, chunk))}"))
+    return card_ids
 
+def find_card_ids(source, deck_name=None, tags=None, note_ids=None):
     if note_ids:
-        print(f"Using {len(note_ids)} selected notes")
-        query = f"nid:{' OR nid:'.join(map(str, note_ids))}"
-        card_ids = anki_request("findCards", {"query": query})
-    else:
-        if not deck_name and not tags:
-            raise ValueError("Please provide a deck or tags.")
-        query = build_query(deck_name, tags)
-        card_ids = anki_request("findCards", {"query": query})
-        print(f"Found {len(card_ids)} cards matching query: '{query}'")
+        note_ids = list(note_ids)
+        card_ids = find_note_card_ids(source, note_ids)
+        print(f"Found {len(card_ids)} cards in {len(note_ids)} selected notes")
+        return card_ids
+    if not deck_name and not tags:
+        raise ValueError("Please provide a deck or tags.")
+    query = build_query(deck_name, tags)
+    card_ids = source.find_cards(query)
+    print(f"Found {len(card_ids)} cards matching query: '{query}'")
+    return card_ids
+
+def find_note_ids(source, deck_name=None, tags=None, note_ids=None):
+    if note_ids:
+        return list(note_ids)
+    return source.find_notes(build_query(deck_name, tags))
+
+def export_to_html_gui(deck_name=None, tags=None, note_ids=None, output_base=None, progress_callback=None,
+                       stop_flag=None, source=None, page_size=CARD_PAGE_SIZE, media_mode="auto",
+                       downloader=None, incremental=False, media_cache=None, cards_per_page=None,
+                       sidecar_fields=False, render_workers=1, observer=None, resume=False, note_mode=False,
+                       archive=False, search_index=False, image_processor=None):
+    print("Starting export_to_html_gui()")
+    source = source or default_source()
+    print(f"Reading cards through {source.name}")
+    stats = ExportStats(observer)
 
+    with stats.stage("find_cards"):
+        card_ids = find_card_ids(source, deck_name, tags, note_ids)
     if not card_ids:
         print("No cards found.")
         return 0
 
-    cards = get_card_info(card_ids)
-    total = len(cards)
-
-    media_folder = os.path.join(output_base, "media")
-    css_folder = os.path.join(output_base, "css")
-
-    os.makedirs(media_folder, exist_ok=True)
-    os.makedirs(css_folder, exist_ok=True)
-
-    html_file = os.path.join(output_base, "index.html")
-    css_file = os.path.join(css_folder, "styles.css")
-
-    with open(css_file, "w", encoding="utf-8") as f:
-        f.write("""
-        body { font-family: Arial, sans-serif; background: #121212; color: #ffffff; display: flex; flex-direction: column; align-items: center; padding: 20px; }
-        .card { border: 1px solid #444; padding: 20px; margin: 10px; border-radius: 8px; background: #1e1e1e; width: 90%; max-width: 900px; text-align: center; position: relative; }
-        .card-id { font-size: 12px; color: #aaa; text-decoration: none; position: absolute; top: 5px; right: 10px; }
-        .tags { font-size: 12px; color: #aaa; margin-top: 10px; border-top: 1px solid #444; padding-top: 5px; }
-        img { max-width: 100%; height: auto; display: block; margin: 10px auto; }
-        .extra-info-button { background-color: #333; color: #fff; border: none; padding: 5px 10px; cursor: pointer; margin-top: 5px; border-radius: 5px; text-decoration: none; display: inline-block; }
-        .extra-info-button:hover { background-color: #555; }
-        """)
-
-    with open(html_file, "w", encoding="utf-8") as out:
-        out.write("<html><head><meta charset='utf-8'><title>Exported Cards</title>")
-        out.write("<meta name='viewport' content='width=device-width, initial-scale=1'>")
-        out.write("<link rel='stylesheet' type='text/css' href='css/styles.css'>")
-        out.write("<script>")
-        out.write("""
-        function openExtraInfo(content, isImage, isURL) {
-            let newWindow = window.open("", "_blank", "width=800,height=600");
-            newWindow.document.write(`
-                <html>
-                <head>
-                    <meta name='viewport' content='width=device-width, initial-scale=1'>
-                    <title>Extra Info</title>
-                    <style>
-                        body { background:#ffffff; color:#000; font-family: Arial, sans-serif; padding: 20px; margin: 0; }
-                        img, iframe { max-width: 100%; max-height: 90vh; height: auto; width: auto; display: block; margin: auto; }
-                    </style>
-                </head>
-                <body>`);
-            if (isURL) {
-                newWindow.document.write(`<iframe src='${content}'></iframe>`);
-            } else if (isImage) {
-                newWindow.document.write(`<img src='${content}'>`);
-            } else {
-                newWindow.document.write(decodeURIComponent(content));
-            }
-            newWindow.document.write(`</body></html>`);
-            newWindow.document.close();
-        }
-        """)
-        out.write("</script></head><body>")
-
-        for i, card in enumerate(cards):
+    if note_mode:
+        with stats.stage("find_cards"):
+            export_note_ids = find_note_ids(source, deck_name, tags, note_ids)
+        unit_ids = [f"n{note_id}" for note_id in export_note_ids]
+        print(f"Grouping {len(card_ids)} cards into {len(unit_ids)} notes")
+
+        def iter_units(start):
+            return iter_note_pages(export_note_ids[start:], card_ids, source, page_size)
+    else:
+        unit_ids = card_ids
+
+        def iter_units(start):
+            return iter_card_pages(card_ids[start:], source, page_size)
+
+    total = len(unit_ids)
+    unit_name = "notes" if note_mode else "cards"
+    progress = ProgressReporter(total, progress_callback, stats, unit=unit_name)
+
+    layout = {"cards_per_page": cards_per_page, "sidecar_fields": sidecar_fields}
+    if note_mode:
+        layout["note_mode"] = True
+    if image_processor:
+        # Rendered img tags depend on the image settings
+        layout["images"] = image_processor.key
+    header = {"cards": hash_bytes(",".join(map(str, unit_ids)).encode("ascii")), "layout": layout,
+              "incremental": bool(incremental)}
+    if search_index:
+        header["search"] = True
+    export_archive = None
+    journal = None
+    resumed = []
+    if archive:
+        # The zip is streamed in one pass to a partial file and renamed into place;
+        # only downloads pass through a scratch folder on their way into it.
+        if resume or incremental:
+            print("Archive output is written in one pass; resume and incremental updates do not apply")
+        resume = incremental = False
+        html_file = archive_path(output_base)
+        staging = staging_path(html_file)
+        export_archive = ExportArchive(staging, os.path.splitext(os.path.basename(html_file))[0])
+        media_folder = tempfile.mkdtemp(prefix="anki-html-media-")
+        export_archive.write_bytes("css/styles.css", STYLES_CSS.encode("utf-8"))
+    else:
+        # Everything is written to a staging folder beside output_base and only swapped
+        # in once complete; a stopped or crashed export leaves its journal there to resume.
+        staging = staging_path(output_base)
+        journal = ExportJournal.load(staging, header) if resume else None
+        resumed = list(journal.cards.items()) if journal else []
+        if resumed and [card_id for card_id, _ in resumed] == [str(unit_id) for unit_id in unit_ids[:len(resumed)]]:
+            print(f"Resuming interrupted export after {len(resumed)} of {total} {unit_name}")
+        else:
+            if resume:
+                print("No matching interrupted export to resume, starting over")
+            resumed = []
+            reset_staging(staging)
+            journal = ExportJournal(staging, header)
+
+        media_folder = os.path.join(staging, "media")
+        css_folder = os.path.join(staging, "css")
+
+        os.makedirs(media_folder, exist_ok=True)
+        os.makedirs(css_folder, exist_ok=True)
+
+        html_file = os.path.join(output_base, "index.html")
+        css_file = os.path.join(css_folder, "styles.css")
+
+        write_if_changed(css_file, STYLES_CSS)
+
+    manifest = (ExportManifest.load(output_base, layout, output_base=staging, media_path=source.media_path)
+                if incremental else None)
+    previous_files = {}
+    if cards_per_page:
+        writer = ShardedWriter(staging, total, cards_per_page, archive=export_archive, search=search_index)
+    else:
+        writer = SingleFileWriter(staging, archive=export_archive, search=search_index)
+    field_store = None
+    if sidecar_fields:
+        field_store = FieldStore(staging, previous_folder=os.path.join(output_base, "fields"), archive=export_archive)
+
+    search = SearchIndex(staging, archive=export_archive) if search_index else None
+
+    def field_chunk(ordinal):
+        return field_store.chunk_for(ordinal) if field_store else None
+
+    def previous_fragment(entry):
+        name = entry.get("file", "index.html")
+        if name not in previous_files:
+            previous_files[name] = open(os.path.join(output_base, name), "rb")
+        previous = previous_files[name]
+        previous.seek(entry["offset"])
+        return previous.read(entry["length"])
+
+    render_pool = RenderPool(render_workers)
+    own_downloader = downloader is None
+    downloader = downloader or ExternalDownloader(cache=media_cache)
+    cache_counts = (media_cache.hits, media_cache.misses) if media_cache else None
+    media_map = {name: entry["path"] for name, entry in journal.media.items()} if journal else {}
+    requested_media = set(media_map)
+    unjournaled_media = []
+    # Scaled variants of images by media name, and the workers still producing them
+    image_info = {}
+    pending_images = {}
+    originals = {}
+    done = len(resumed)
+    reused = 0
+    # Cards inside the exported notes; in note mode done counts notes
+    note_cards = sum(len(entry.get("cards", ())) for _, entry in resumed)
+
+    def journal_media(name):
+        entry = manifest.media.get(name) if manifest else None
+        if entry is None:
+            entry = {"path": media_map[name]}
+            if name in image_info:
+                entry["image"] = image_info[name]
+        return entry
+
+    def checkpoint(cards):
+        if not journal:
+            return
+        media = {name: journal_media(name) for name in dict.fromkeys(unjournaled_media)}
+        unjournaled_media.clear()
+        with stats.stage("checkpoint"):
+            writer.flush()
+            journal.checkpoint(cards, media)
+
+    def queue_image(name, source=None):
+        if not image_processor or not is_image_path(media_map[name], SCALABLE_EXTENSIONS):
+            return
+        info = (manifest.media.get(name) or {}).get("image") if manifest else None
+        if info and info["key"] == image_processor.key:
+            image_info[name] = info
+            return
+        source = source or originals.pop(name, None) or os.path.join(staging, media_map[name])
+        pending_images[name] = image_processor.submit(source)
+
+    def place_image(name, result):
+        variants = []
+        for width, height, path in result["variants"]:
+            local_path = f"{SCALED_FOLDER}/{os.path.basename(path)}"
+            if export_archive:
+                if local_path not in export_archive:
+                    export_archive.write_file(local_path, path)
+            elif not os.path.exists(os.path.join(staging, local_path)):
+                materialize_file(path, os.path.join(staging, local_path))
+            variants.append([width, height, local_path])
+            stats.count("scaled_bytes", os.path.getsize(path))
+        info = {"key": image_processor.key, "width": result["width"], "height": result["height"],
+                "variants": variants}
+        image_info[name] = info
+        if manifest and name in manifest.media:
+            manifest.media[name]["image"] = info
+        # Journaled again with its variants
+        unjournaled_media.append(name)
+        stats.count("images_scaled" if variants else "images_kept")
+        if result["cached"]:
+            stats.count("image_cache_hits")
+
+    def resolve_images(names):
+        for name in names:
+            future = pending_images.pop(name, None)
+            if future is None:
+                continue
+            try:
+                with stats.stage("images"):
+                    result = future.result()
+                    if result:
+                        place_image(name, result)
+            except Exception as e:
+                print(f"Could not scale image {name}, keeping the original → {e}")
+
+    def render_source(name):
+        local_path = media_map[name]
+        if image_processor and is_image_path(local_path):
+            return image_source(local_path, image_info.get(name))
+        return local_path
+
+    def write_page(cards, page_media, first_ordinal):
+        nonlocal done, reused, note_cards
+        for url in page_media:
+            if url in media_map or not is_external_url(url):
+                continue
+            with stats.stage("external_downloads"):
+                local_path = downloader.result(url, media_folder, export_archive)
+            if local_path:
+                media_map[url] = local_path
+                unjournaled_media.append(url)
+                stats.count("external_files")
+                if export_archive:
+                    stats.count("external_bytes", export_archive.getsize(local_path))
+                else:
+                    stats.count("external_bytes", os.path.getsize(os.path.join(staging, local_path)))
+                if manifest:
+                    manifest.record_media(url, local_path)
+                queue_image(url, downloader.downloaded_path(url) if export_archive else None)
+        resolve_images(page_media)
+
+        chunks = [field_chunk(ordinal) for ordinal in range(first_ordinal, first_ordinal + len(cards))]
+        entries = [manifest.unchanged_card(card, chunk) if manifest else None for card, chunk in zip(cards, chunks)]
+        page_media_map = {name: render_source(name) for name in page_media if name in media_map}
+        rendered = stats.timed_iter("render", render_pool.render(
+            [card for card, entry in zip(cards, entries) if not entry],
+            page_media_map,
+            [chunk for chunk, entry in zip(chunks, entries) if not entry],
+            stop_flag,
+        ))
+        page_entries = {}
+        try:
+            for card, chunk, entry in zip(cards, chunks, entries):
+                if stop_flag and stop_flag():
+                    return False
+                card_id = card["cardId"]
+                nested_ids = [nested["cardId"] for nested in card["cards"]] if note_mode else ()
+                if entry:
+                    fields = None
+                    with stats.stage("write"):
+                        fragment = previous_fragment(entry)
+                        location = writer.write_card(card_id, fragment, nested_ids)
+                        manifest.carry_card(card_id, entry, *location)
+                        if field_store:
+                            fields = field_store.previous_fields(chunk, card_id)
+                            field_store.add(chunk, card_id, fields)
+                    reused += 1
+                else:
+                    result = next(rendered, None)
+                    if result is None:
+                        return False
+                    fragment, fields = result
+                    fragment = fragment.encode("utf-8")
+                    with stats.stage("write"):
+                        location = writer.write_card(card_id, fragment, nested_ids)
+                        if field_store:
+                            field_store.add(chunk, card_id, fields)
+                    if manifest:
+                        manifest.record_card(card, *location, len(fragment), hash_bytes(fragment),
+                                             list(dict.fromkeys(card_media_filenames(card))), chunk)
+                if manifest:
+                    journal_entry = dict(manifest.cards[str(card_id)])
+                else:
+                    journal_entry = {"file": location[0], "offset": location[1], "length": len(fragment),
+                                     "chunk": chunk}
+                    if note_mode:
+                        journal_entry["cards"] = nested_ids
+                if fields:
+                    journal_entry["fields"] = fields
+                if search:
+                    with stats.stage("search_index"):
+                        title, terms = search.add(card_id, location[0], card)
+                    journal_entry["search"] = [title, " ".join(terms)]
+                page_entries[str(card_id)] = journal_entry
+                stats.count("html_bytes", len(fragment))
+                if note_mode:
+                    stats.count("note_cards", len(nested_ids))
+                    note_cards += len(nested_ids)
+                done += 1
+                progress.update(done)
+        finally:
+            rendered.close()
+            checkpoint(page_entries)
+        return True
+
+    completed = False
+    try:
+        if resumed:
+            writer.restore(resumed)
+            if field_store:
+                field_store.restore(resumed)
+            if search:
+                search.restore(resumed)
+            if manifest:
+                for card_id, entry in resumed:
+                    manifest.cards[str(card_id)] = {key: value for key, value in entry.items()
+                                                    if key not in ("fields", "search")}
+                manifest.media.update({name: entry for name, entry in journal.media.items() if "hash" in entry})
+            if image_processor:
+                # Images fetched before the interruption whose variants were not journaled yet
+                for name, entry in journal.media.items():
+                    if "image" in entry:
+                        image_info[name] = entry["image"]
+                    else:
+                        queue_image(name)
+        else:
+            writer.start()
+        if journal:
+            journal.open()
+        # Pages are written one step behind so external downloads overlap the next fetch
+        pending = None
+        first_ordinal = len(resumed)
+        for cards in stats.timed_iter("cards_info", iter_units(first_ordinal)):
             if stop_flag and stop_flag():
                 return 0
 
-            answer = card.get("answer", "")
-            answer = re.sub(r'<div id="tags-container".*?>.*?</div>', '', answer, flags=re.DOTALL | re.IGNORECASE)
-            fields = card.get("fields", {})
-            tags = card.get("tags", [])
-
-            for media_file in extract_media_filenames(answer):
-                local_path = download_media_file(media_file, media_folder)
-                if local_path:
-                    answer = answer.replace(media_file, local_path)
-                elif is_external_url(media_file):
-                    button = f"<button class='extra-info-button' onclick=\"openExtraInfo('{media_file}', false, true)\">External Media</button>"
-                    answer += button
-
-            out.write("<div class='card'>")
-            out.write(f"<a href='#{card['cardId']}' class='card-id' id='{card['cardId']}'>Card ID: {card['cardId']}</a>")
-            out.write(f"<div>{answer}</div>")
-
-            for field_name, content in fields.items():
-                val = content.get("value", "").strip()
-                if not val or val in answer or field_name.lower() in ["front", "question"]:
-                    continue
-                for media_file in extract_media_filenames(val):
-                    local_path = download_media_file(media_file, media_folder)
-                    if local_path:
-                        val = val.replace(media_file, local_path)
-                    elif is_external_url(media_file):
-                        val = val.replace(media_file, media_file)
-
-                val_encoded = urllib.parse.quote(val)
-                out.write(f"<button class='extra-info-button' onclick=\"openExtraInfo(this.dataset.content, false, false)\" data-content='{val_encoded}'>{html.escape(field_name)}</button>")
-
-            if tags:
-                out.write(f"<p class='tags'>Tags: {', '.join(tags)}</p>")
-            out.write("</div>")
-
-            if progress_callback:
-                progress_callback(i + 1, total)
-
-        out.write("</body></html>")
-
-    print(f"Export complete: {html_file}")
-    return total
+            if manifest:
+                with stats.stage("note_mod_times"):
+                    ensure_note_mod_times(cards, source)
+                changed = [
+                    card for ordinal, card in enumerate(cards, first_ordinal)
+                    if not manifest.unchanged_card(card, field_chunk(ordinal))
+                ]
+            else:
+                changed = cards
+
+            # Only fetch media not already requested by an earlier page
+            with stats.stage("media_scan"):
+                page_media = collect_media_filenames(changed)
+            new_media = [name for name in page_media if name not in requested_media]
+            requested_media.update(new_media)
+            fetched = fetch_media_files(new_media, media_folder, source, media_mode=media_mode,
+                                        downloader=downloader, manifest=manifest, cache=media_cache, stats=stats,
+                                        archive=export_archive, originals=originals)
+            media_map.update(fetched)
+            unjournaled_media.extend(fetched)
+            for name in fetched:
+                queue_image(name)
+            originals.clear()
+
+            if pending and not write_page(*pending):
+                return 0
+            pending = (cards, page_media, first_ordinal)
+            first_ordinal += len(cards)
+
+        if pending and not write_page(*pending):
+            return 0
+
+        with stats.stage("finalize"):
+            writer.close()
+            if field_store:
+                field_store.close()
+            if search:
+                stats.count("search_terms", search.close())
+        completed = True
+    finally:
+        writer.abort()
+        if journal:
+            journal.close()
+        render_pool.close()
+        for future in pending_images.values():
+            future.cancel()
+        if own_downloader:
+            downloader.close(cancel=True)
+        if export_archive:
+            shutil.rmtree(media_folder, ignore_errors=True)
+            if not completed:
+                export_archive.abort()
+        for previous in previous_files.values():
+            previous.close()
+        if media_cache:
+            media_cache.save()
+
+    # The report's cards_per_second counts cards in either mode
+    stats.count("cards", note_cards if note_mode else done)
+    if note_mode:
+        stats.count("notes", done)
+    if resumed:
+        stats.count("cards_resumed", len(resumed))
+    if manifest:
+        with stats.stage("finalize"):
+            removed = manifest.remove_orphans()
+            manifest.save()
+        stats.count("cards_reused", reused)
+        stats.count("orphans_removed", removed)
+        print(f"Incremental export: {reused} {unit_name} reused, {done - reused - len(resumed)} re-rendered, "
+              f"{removed} orphaned media removed")
+
+    if media_cache:
+        hits = media_cache.hits - cache_counts[0]
+        misses = media_cache.misses - cache_counts[1]
+        stats.count("media_cache_hits", hits)
+        stats.count("media_cache_misses", misses)
+        print(f"Media cache: {hits} hits, {misses} misses")
+
+    if export_archive:
+        report = stats.save(staging, export_archive)
+        export_archive.close()
+        os.replace(staging, html_file)
+        write_viewer(os.path.dirname(html_file))
+    else:
+        report = stats.save(staging)
+        finalize_staging(staging, output_base)
+    slowest = ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in list(report["stages"].items())[:3])
+    print(f"Export complete: {html_file} ({len(media_map)} media files, {report['cards_per_second']} cards/s; {slowest})")
+    return note_cards if note_mode else done
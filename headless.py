@@ -0,0 +1,17 @@
+import importlib
+import os
+import sys
+import types
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_NAME = "search_to_html"
+
+
+def load_addon_module(name):
+    # Register the add-on folder as a bare package so its modules import without
+    # running __init__.py, which needs a live Anki main window.
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [ADDON_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
@@ -0,0 +1,306 @@
+import json
+import math
+import os
+
+STYLES_CSS = """
+        body { font-family: Arial, sans-serif; background: #121212; color: #ffffff; display: flex; flex-direction: column; align-items: center; padding: 20px; }
+        .card { border: 1px solid #444; padding: 20px; margin: 10px; border-radius: 8px; background: #1e1e1e; width: 90%; max-width: 900px; text-align: center; position: relative; }
+        .card-id { font-size: 12px; color: #aaa; text-decoration: none; position: absolute; top: 5px; right: 10px; }
+        .note-card { position: relative; padding: 20px 0 10px; border-bottom: 1px dashed #444; }
+        .tags { font-size: 12px; color: #aaa; margin-top: 10px; border-top: 1px solid #444; padding-top: 5px; }
+        img { max-width: 100%; height: auto; display: block; margin: 10px auto; }
+        img[data-original] { cursor: zoom-in; }
+        .extra-info-button { background-color: #333; color: #fff; border: none; padding: 5px 10px; cursor: pointer; margin-top: 5px; border-radius: 5px; text-decoration: none; display: inline-block; }
+        .extra-info-button:hover { background-color: #555; }
+        .pager { width: 90%; max-width: 900px; display: flex; justify-content: space-between; margin: 10px; }
+        .pager a, .page-list a { color: #8ab4f8; }
+        .page-list { width: 90%; max-width: 900px; line-height: 1.8; }
+        .search-box { position: fixed; top: 10px; right: 10px; width: 320px; z-index: 10; text-align: left; }
+        .search-box input { width: 100%; box-sizing: border-box; padding: 6px 8px; border: 1px solid #444; border-radius: 5px; background: #1e1e1e; color: #fff; }
+        .search-results { max-height: 60vh; overflow-y: auto; margin-top: 4px; background: #1e1e1e; border: 1px solid #444; border-radius: 5px; font-size: 13px; }
+        .search-results:empty { display: none; }
+        .search-results a, .search-results p { display: block; margin: 0; padding: 6px 8px; border-bottom: 1px solid #333; color: #8ab4f8; text-decoration: none; }
+        .search-results p { color: #aaa; }
+        """
+
+EXTRA_INFO_SCRIPT = """
+        function openExtraInfo(content, isImage, isURL) {
+            writeExtraInfo(window.open("", "_blank", "width=800,height=600"), content, isImage, isURL);
+        }
+        function writeExtraInfo(newWindow, content, isImage, isURL) {
+            newWindow.document.open();
+            newWindow.document.write(`
+                <html>
+                <head>
+                    <meta name='viewport' content='width=device-width, initial-scale=1'>
+                    <title>Extra Info</title>
+                    <style>
+                        body { background:#ffffff; color:#000; font-family: Arial, sans-serif; padding: 20px; margin: 0; }
+                        img, iframe { max-width: 100%; max-height: 90vh; height: auto; width: auto; display: block; margin: auto; }
+                    </style>
+                </head>
+                <body>`);
+            if (isURL) {
+                newWindow.document.write(`<iframe src='${content}'></iframe>`);
+            } else if (isImage) {
+                newWindow.document.write(`<img src='${content}'>`);
+            } else {
+                newWindow.document.write(decodeURIComponent(content));
+            }
+            newWindow.document.write(`</body></html>`);
+            newWindow.document.close();
+        }
+        function loadScript(src) {
+            var script = document.createElement("script");
+            script.src = src;
+            document.head.appendChild(script);
+        }
+        var fieldChunks = {};
+        var fieldChunkWaiters = {};
+        function loadFieldChunk(number, fields) {
+            fieldChunks[number] = fields;
+            (fieldChunkWaiters[number] || []).forEach(function (waiter) { waiter(); });
+            delete fieldChunkWaiters[number];
+        }
+        function openExtraField(button) {
+            var number = button.dataset.chunk, card = button.dataset.card, field = button.dataset.field;
+            // Open the window inside the click so popup blockers allow it, fill it once loaded
+            var newWindow = window.open("", "_blank", "width=800,height=600");
+            var show = function () {
+                writeExtraInfo(newWindow, encodeURIComponent(fieldChunks[number][card][field]), false, false);
+            };
+            if (fieldChunks[number]) { show(); return; }
+            if (!fieldChunkWaiters[number]) {
+                fieldChunkWaiters[number] = [];
+                loadScript("fields/fields-" + String(number).padStart(4, "0") + ".js");
+            }
+            fieldChunkWaiters[number].push(show);
+        }
+        """
+
+HTML_HEAD = (
+    "<html><head><meta charset='utf-8'><title>{title}</title>"
+    "<meta name='viewport' content='width=device-width, initial-scale=1'>"
+    "<link rel='stylesheet' type='text/css' href='css/styles.css'>"
+    "<script>" + EXTRA_INFO_SCRIPT.replace("{", "{{").replace("}", "}}") + "</script>{search}</head><body>"
+)
+HTML_FOOT = "</body></html>"
+SEARCH_HEAD = "<script src='search/search.js'></script>"
+
+LANDING_SCRIPT = """
+        var cardId = location.hash.slice(1);
+        var page = cardId && CARD_INDEX.cards[cardId];
+        if (page) { location.replace(CARD_INDEX.pages[page - 1] + "#" + cardId); }
+        """
+
+
+def page_head(title="Exported Cards", search=False):
+    return HTML_HEAD.format(title=title, search=SEARCH_HEAD if search else "")
+
+
+class PageWriter:
+    def __init__(self, output_base, archive=None, search=False):
+        self.output_base = output_base
+        self.archive = archive
+        self.search = search
+        self.written = []
+        self._out = None
+        self._name = None
+        self._offset = 0
+
+    def _open(self, name, head):
+        self._close_file()
+        if self.archive:
+            self._out = self.archive.open(name)
+        else:
+            self._out = open(os.path.join(self.output_base, name), "wb")
+        self._name = name
+        self._offset = 0
+        self.written.append(name)
+        self._write(head.encode("utf-8"))
+
+    def _write(self, data):
+        self._out.write(data)
+        self._offset += len(data)
+
+    def _close_file(self, foot=None):
+        if self._out:
+            if foot is not None:
+                self._write(foot.encode("utf-8"))
+            self._out.close()
+            self._out = None
+
+    def write_card(self, card_id, fragment, aliases=()):
+        location = (self._name, self._offset)
+        self._write(fragment)
+        return location
+
+    def restore(self, cards):
+        # cards are (card_id, entry) pairs of an interrupted export in order; the
+        # file of the last one is reopened and cut back to the end of that card.
+        for card_id, entry in cards:
+            if entry["file"] not in self.written:
+                self.written.append(entry["file"])
+        card_id, last = cards[-1]
+        end = last["offset"] + last["length"]
+        self._out = open(os.path.join(self.output_base, last["file"]), "r+b")
+        self._out.truncate(end)
+        self._out.seek(end)
+        self._name = last["file"]
+        self._offset = end
+
+    def flush(self):
+        if self._out and not self.archive:
+            self._out.flush()
+            os.fsync(self._out.fileno())
+
+    def abort(self):
+        self._close_file()
+
+
+class FieldStore:
+    # Extra field bodies live in fields/fields-NNNN.js and are loaded on demand
+    # by openExtraField, keeping them out of the pages the browser parses up front.
+    def __init__(self, output_base, cards_per_chunk=200, previous_folder=None, archive=None):
+        self.folder = os.path.join(output_base, "fields")
+        self.previous_folder = previous_folder or self.folder
+        self.cards_per_chunk = cards_per_chunk
+        self.archive = archive
+        self._chunk = None
+        self._fields = {}
+        self._previous = (None, None)
+        if not archive:
+            os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def chunk_name(number):
+        return f"fields-{number:04d}.js"
+
+    def chunk_for(self, ordinal):
+        return ordinal // self.cards_per_chunk + 1
+
+    def add(self, chunk, card_id, fields):
+        if chunk != self._chunk:
+            self._flush()
+            self._chunk = chunk
+        if fields:
+            self._fields[str(card_id)] = fields
+
+    def restore(self, cards):
+        # Chunks before the last card's were complete on disk; its own is rebuilt in memory
+        self._chunk = cards[-1][1]["chunk"]
+        self._fields = {
+            str(card_id): entry["fields"] for card_id, entry in cards
+            if entry["chunk"] == self._chunk and entry.get("fields")
+        }
+
+    def previous_fields(self, chunk, card_id):
+        number, fields = self._previous
+        if number != chunk:
+            path = os.path.join(self.previous_folder, self.chunk_name(chunk))
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            fields = json.loads(text[text.index(",") + 1:text.rindex(")")])
+            self._previous = (chunk, fields)
+        return fields.get(str(card_id), {})
+
+    def _flush(self):
+        if self._chunk is None:
+            return
+        text = f"loadFieldChunk({self._chunk},{json.dumps(self._fields, ensure_ascii=False, separators=(',', ':'))});\n"
+        if self.archive:
+            self.archive.write_bytes(f"fields/{self.chunk_name(self._chunk)}", text.encode("utf-8"))
+        else:
+            with open(os.path.join(self.folder, self.chunk_name(self._chunk)), "w", encoding="utf-8") as f:
+                f.write(text)
+        self._fields = {}
+
+    def close(self):
+        self._flush()
+        self._chunk = None
+
+
+class SingleFileWriter(PageWriter):
+    def start(self):
+        self._open("index.html", page_head(search=self.search))
+
+    def close(self):
+        self._close_file(HTML_FOOT)
+
+
+class ShardedWriter(PageWriter):
+    def __init__(self, output_base, total_cards, cards_per_page=1000, archive=None, search=False):
+        super().__init__(output_base, archive, search)
+        self.cards_per_page = cards_per_page
+        self.page_count = max(1, math.ceil(total_cards / cards_per_page))
+        self.pages = []
+        self.card_pages = {}
+        self._page_cards = 0
+
+    @staticmethod
+    def page_name(number):
+        return f"page-{number:04d}.html"
+
+    def _pager(self, number):
+        links = ["<a href='index.html'>All pages</a>"]
+        if number > 1:
+            links.append(f"<a href='{self.page_name(number - 1)}'>&lsaquo; Previous</a>")
+        links.append(f"<span>Page {number} of {self.page_count}</span>")
+        if number < self.page_count:
+            links.append(f"<a href='{self.page_name(number + 1)}'>Next &rsaquo;</a>")
+        return f"<nav class='pager'>{''.join(links)}</nav>"
+
+    def start(self):
+        pass
+
+    def restore(self, cards):
+        for card_id, entry in cards:
+            if not self.pages or self.pages[-1]["name"] != entry["file"]:
+                self.pages.append({"name": entry["file"], "first": card_id, "last": card_id, "cards": 0})
+                self._page_cards = 0
+            page = self.pages[-1]
+            page["last"] = card_id
+            page["cards"] += 1
+            self._page_cards += 1
+            self.card_pages[str(card_id)] = len(self.pages)
+            for alias in entry.get("cards", ()):
+                self.card_pages[str(alias)] = len(self.pages)
+        super().restore(cards)
+
+    def write_card(self, card_id, fragment, aliases=()):
+        if self._out is None or self._page_cards >= self.cards_per_page:
+            if self._out is not None:
+                self._close_file(self._pager(len(self.pages)) + HTML_FOOT)
+            number = len(self.pages) + 1
+            name = self.page_name(number)
+            self.pages.append({"name": name, "first": card_id, "last": card_id, "cards": 0})
+            self._open(name, page_head(f"Exported Cards - Page {number}", self.search) + self._pager(number))
+            self._page_cards = 0
+        page = self.pages[-1]
+        page["last"] = card_id
+        page["cards"] += 1
+        self._page_cards += 1
+        self.card_pages[str(card_id)] = len(self.pages)
+        # Cards nested in a note block resolve to the note's page
+        for alias in aliases:
+            self.card_pages[str(alias)] = len(self.pages)
+        return super().write_card(card_id, fragment)
+
+    def close(self):
+        self._close_file(self._pager(len(self.pages)) + HTML_FOOT)
+        index = {"pages": [page["name"] for page in self.pages], "cards": self.card_pages}
+        self._open("card-index.js", "window.CARD_INDEX = ")
+        self._write(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        self._write(b";\n")
+        self._close_file()
+
+        items = "".join(
+            f"<li><a href='{page['name']}'>Page {number}</a> &middot; {page['cards']} cards "
+            f"(<a href='{page['name']}#{page['first']}'>{page['first']}</a> &ndash; "
+            f"<a href='{page['name']}#{page['last']}'>{page['last']}</a>)</li>"
+            for number, page in enumerate(self.pages, 1)
+        )
+        self._open("index.html", page_head(search=self.search))
+        self._write(f"<script src='card-index.js'></script><script>{LANDING_SCRIPT}</script>".encode("utf-8"))
+        self._write(f"<div class='page-list'><h1>Exported Cards</h1><ol>{items}</ol></div>".encode("utf-8"))
+        self._close_file(HTML_FOOT)
@@ -0,0 +1,227 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+
+from .media import sniff_media_type, HEADER_SIZE
+from .render_pool import worker_executor
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+SCALED_FOLDER = "media/scaled"
+# Files worth sending to a worker; the worker sniffs the content before decoding
+SCALABLE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+LAZY_EXTENSIONS = SCALABLE_EXTENSIONS + (".gif", ".svg", ".avif", ".ico")
+# GIFs may be animated and SVGs are already small, so neither is decoded
+SCALABLE_TYPES = ("image/png", "image/jpeg", "image/webp", "image/bmp", "image/tiff")
+# Browsers cannot show these at all, so they are re-encoded whatever their size
+TRANSCODED_TYPES = ("image/bmp", "image/tiff")
+OUTPUT_FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg"), "png": ("PNG", "png")}
+DEFAULT_MAX_DIMENSION = 1600
+DEFAULT_QUALITY = 80
+DEFAULT_MAX_CACHE_BYTES = 1024 ** 3
+# EXIF orientations that swap width and height
+ROTATED = (5, 6, 7, 8)
+
+
+def is_image_path(path, extensions=LAZY_EXTENSIONS):
+    return os.path.splitext(path)[1].lower() in extensions
+
+
+def variant_sizes(width, height, settings, transcode=False):
+    # Longest side at max_dimension, plus half of that for the srcset; never upscaled
+    longest = max(width, height)
+    max_dimension = settings["max_dimension"]
+    if longest <= max_dimension and not transcode:
+        return []
+    targets = [max_dimension, max_dimension // 2] if settings["srcset"] else [max_dimension]
+    targets = sorted({min(target, longest) for target in targets if target > 0}, reverse=True)
+    return [(max(1, round(width * target / longest)), max(1, round(height * target / longest)))
+            for target in targets]
+
+
+def _cached(info_path):
+    try:
+        with open(info_path, encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    folder = os.path.dirname(info_path)
+    paths = [os.path.join(folder, name) for _, _, name in info["variants"]]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    # Recently used entries survive pruning
+    for path in [info_path] + paths:
+        os.utime(path)
+    info["variants"] = [[width, height, path] for (width, height, _), path in zip(info["variants"], paths)]
+    return info
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _save(image, path, image_format, quality):
+    if image_format == "WEBP":
+        # method 2 encodes about 2.5x faster than the default 4 for files within a few percent
+        image.save(path, "WEBP", quality=quality, method=2)
+    elif image_format == "JPEG":
+        image.save(path, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(path, "PNG", compress_level=6)
+
+
+def process_image(source, settings, cache_dir):
+    # Runs in a worker. source is the path or the bytes of an original; returns
+    # {"width", "height", "variants": [[width, height, path], ...], "cached"} with
+    # the variants in cache_dir, largest first, or None for anything not scalable.
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source
+    media_type = sniff_media_type(data[:HEADER_SIZE])
+    if media_type not in SCALABLE_TYPES:
+        return None
+    digest = hashlib.sha1(data).hexdigest()
+    folder = os.path.join(cache_dir, digest[:2])
+    info_path = os.path.join(folder, f"{digest}-{settings['key']}.json")
+    info = _cached(info_path)
+    if info:
+        info["cached"] = True
+        return info
+
+    os.makedirs(folder, exist_ok=True)
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        rotated = image.getexif().get(0x0112) in ROTATED
+        if rotated:
+            width, height = height, width
+        sizes = variant_sizes(width, height, settings, media_type in TRANSCODED_TYPES)
+        variants = []
+        if sizes:
+            # JPEGs decode straight at a fraction of their size when that is still large enough
+            image.draft(None, sizes[0][::-1] if rotated else sizes[0])
+            scaled = ImageOps.exif_transpose(image)
+            alpha = scaled.mode in ("RGBA", "LA", "PA") or (scaled.mode == "P" and "transparency" in scaled.info)
+            if scaled.mode not in ("RGB", "RGBA"):
+                scaled = scaled.convert("RGBA" if alpha else "RGB")
+            image_format, extension = OUTPUT_FORMATS[settings["format"]]
+            if alpha and image_format == "JPEG":
+                image_format, extension = OUTPUT_FORMATS["png"]
+            for size in sizes:
+                # Each smaller variant is resized from the previous one
+                scaled = scaled.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                name = f"{digest}-{settings['key']}-{size[0]}x{size[1]}.{extension}"
+                _write_atomic(os.path.join(folder, name),
+                              lambda path: _save(scaled, path, image_format, settings["quality"]))
+                variants.append([size[0], size[1], name])
+    info = {"width": width, "height": height, "variants": variants}
+    _write_atomic(info_path, lambda path: _write_json(path, info))
+    info["variants"] = [[w, h, os.path.join(folder, name)] for w, h, name in variants]
+    info["cached"] = False
+    return info
+
+
+def image_source(local_path, info=None):
+    # What rendering writes in place of an image's src: the largest variant, a
+    # srcset of all of them and the original for the extra-info popup.
+    if not info:
+        return {"src": local_path}
+    source = {"src": local_path, "width": info["width"], "height": info["height"]}
+    variants = info["variants"]
+    if variants:
+        source["width"], source["height"], source["src"] = variants[0]
+        source["original"] = local_path
+        if len(variants) > 1:
+            source["srcset"] = ", ".join(f"{path} {width}w" for width, _, path in reversed(variants))
+    return source
+
+
+class ImageProcessor:
+    # Downscales and re-encodes images on worker processes or threads. Results are kept in
+    # cache_dir under the content hash and settings, so an image is only decoded
+    # again when it changed; without a cache_dir a scratch folder is used.
+    def __init__(self, max_dimension=DEFAULT_MAX_DIMENSION, quality=DEFAULT_QUALITY, image_format="webp",
+                 srcset=True, workers=None, cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+        if image_format not in ("webp", "jpeg"):
+            raise ValueError(f"Unknown image format: {image_format}")
+        self.available = Image is not None
+        if self.available and image_format == "webp" and not features.check("webp"):
+            print("This Pillow build cannot write WebP, images are re-encoded as JPEG")
+            image_format = "jpeg"
+        self.settings = {"max_dimension": int(max_dimension), "quality": int(quality), "format": image_format,
+                         "srcset": bool(srcset)}
+        if self.available:
+            self.key = hashlib.sha1(json.dumps(self.settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        else:
+            self.key = "original"
+        self.settings["key"] = self.key
+        self.max_cache_bytes = max_cache_bytes
+        self._scratch = None
+        if not cache_dir:
+            cache_dir = self._scratch = tempfile.mkdtemp(prefix="anki-html-images-")
+        self.cache_dir = cache_dir
+        self._executor = None
+        if not self.available:
+            print("Pillow is not installed; images are exported unchanged and only marked for lazy loading")
+            return
+        # Threads inside Anki still run in parallel: Pillow releases the GIL while it decodes, resizes and encodes
+        self._executor = worker_executor(workers or os.cpu_count() or 1, "images")
+
+    def submit(self, source):
+        if self._executor is None:
+            future = Future()
+            future.set_result(None)
+            return future
+        return self._executor.submit(process_image, source, self.settings, self.cache_dir)
+
+    def prune(self):
+        # Least recently used files go first once the cache is over budget
+        files = []
+        for folder, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._scratch:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+        elif os.path.isdir(self.cache_dir):
+            self.prune()
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+
+from .media import materialize_file
+
+MANIFEST_NAME = "export_manifest.json"
+MANIFEST_VERSION = 3
+
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExportManifest:
+    def __init__(self, output_base, layout=None, cards=None, media=None, previous_base=None, media_path=None):
+        # Files of the previous export are read from previous_base and the ones
+        # kept are linked into output_base, where the new export is staged.
+        # media_path finds the collection file behind a media name, if it is local.
+        self.output_base = output_base
+        self.previous_base = previous_base or output_base
+        self.layout = layout or {}
+        self.previous_cards = cards or {}
+        self.previous_media = media or {}
+        self.media_path = media_path
+        self.cards = {}
+        self.media = {}
+        self._edited = {}
+
+    @classmethod
+    def load(cls, previous_base, layout=None, html_name="index.html", output_base=None, media_path=None):
+        output_base = output_base or previous_base
+        path = os.path.join(previous_base, MANIFEST_NAME)
+        # A manifest without its index.html cannot supply any fragments
+        if not os.path.exists(path) or not os.path.exists(os.path.join(previous_base, html_name)):
+            return cls(output_base, layout, previous_base=previous_base, media_path=media_path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Ignoring unreadable export manifest:", e)
+            return cls(output_base, layout, previous_base=previous_base, media_path=media_path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(output_base, layout, previous_base=previous_base, media_path=media_path)
+        if data.get("layout", {}) != (layout or {}):
+            # Fragments were written into differently shaped files; media can still be reused
+            return cls(output_base, layout, media=data.get("media"), previous_base=previous_base,
+                       media_path=media_path)
+        return cls(output_base, layout, data.get("cards"), data.get("media"), previous_base, media_path)
+
+    def unchanged_card(self, card, field_chunk=None):
+        entry = self.previous_cards.get(str(card["cardId"]))
+        if not entry:
+            return None
+        if entry["mod"] != card.get("mod") or entry["noteMod"] != card.get("noteMod"):
+            return None
+        # Sidecar buttons name their chunk, so a card that moved chunks is re-rendered
+        if entry.get("chunk") != field_chunk:
+            return None
+        # A collection file edited in place keeps its name, so the card is re-rendered with the new file
+        if any(self._media_edited(name) for name in entry.get("media", ())):
+            return None
+        return entry
+
+    def _media_edited(self, name):
+        edited = self._edited.get(name)
+        if edited is None:
+            entry = self.previous_media.get(name)
+            # Only media copied from a local folder recorded its size and mtime
+            if not entry or "size" not in entry or not self.media_path:
+                edited = False
+            else:
+                src_path = self.media_path(name)
+                edited = src_path is None or not self._same_source(entry, src_path)
+            self._edited[name] = edited
+        return edited
+
+    def _same_source(self, entry, src_path):
+        try:
+            stat = os.stat(src_path)
+        except OSError:
+            return False
+        return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime_ns
+
+    def record_card(self, card, file_name, offset, length, fragment_hash, media_names, field_chunk=None):
+        self.cards[str(card["cardId"])] = {
+            "mod": card.get("mod"),
+            "noteMod": card.get("noteMod"),
+            "file": file_name,
+            "offset": offset,
+            "length": length,
+            "hash": fragment_hash,
+            "media": media_names,
+            "chunk": field_chunk,
+        }
+        if "cards" in card:
+            self.cards[str(card["cardId"])]["cards"] = [nested["cardId"] for nested in card["cards"]]
+
+    def carry_card(self, card_id, entry, file_name, offset):
+        self.cards[str(card_id)] = dict(entry, file=file_name, offset=offset)
+        for name in entry.get("media", ()):
+            if name in self.previous_media and name not in self.media and self._adopt(self.previous_media[name]):
+                self.media[name] = self.previous_media[name]
+
+    def _paths(self, entry):
+        # The file itself and the scaled variants of an image, unless they were made with other settings
+        image = entry.get("image")
+        if not image or image.get("key") != self.layout.get("images"):
+            return [entry["path"]]
+        return [entry["path"]] + [variant[2] for variant in image["variants"]]
+
+    def _adopt(self, entry):
+        if self.previous_base == self.output_base:
+            return True
+        for path in self._paths(entry):
+            dest = os.path.join(self.output_base, path)
+            if os.path.exists(dest):
+                continue
+            try:
+                materialize_file(os.path.join(self.previous_base, path), dest)
+            except OSError as e:
+                print(f"Could not reuse {path} from the previous export: {e}")
+                return False
+        return True
+
+    def unchanged_media(self, name, src_path=None):
+        entry = self.previous_media.get(name)
+        if not entry or not os.path.exists(os.path.join(self.previous_base, entry["path"])):
+            return None
+        if src_path and not self._same_source(entry, src_path):
+            return None
+        if not self._adopt(entry):
+            return None
+        self.media[name] = entry
+        return entry["path"]
+
+    def record_media(self, name, local_path, src_path=None, data=None):
+        if data is not None:
+            content_hash = hash_bytes(data)
+        else:
+            content_hash = hash_file(os.path.join(self.output_base, local_path))
+        entry = {"path": local_path, "hash": content_hash}
+        if src_path:
+            stat = os.stat(src_path)
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime_ns
+        self.media[name] = entry
+
+    def remove_orphans(self):
+        referenced = set()
+        for entry in self.cards.values():
+            referenced.update(entry.get("media", ()))
+        kept_paths = {path for name in referenced if name in self.media for path in self._paths(self.media[name])}
+        # Previous media no card refers to any more is dropped, whether or not it was
+        # linked into output_base; the count is of media names, not files
+        removed = set()
+        for name, entry in list(self.previous_media.items()) + list(self.media.items()):
+            if name in referenced or entry["path"] in kept_paths:
+                continue
+            for local_path in self._paths(entry):
+                path = os.path.join(self.output_base, local_path)
+                if local_path not in kept_paths and os.path.exists(path):
+                    os.unlink(path)
+            self.media.pop(name, None)
+            removed.add(name)
+        return len(removed)
+
+    def save(self):
+        path = os.path.join(self.output_base, MANIFEST_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "layout": self.layout, "cards": self.cards,
+                       "media": self.media}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPORT_NAME = "export_report.json"
+
+
+def peak_rss_bytes():
+    # VmHWM starts fresh on exec, while ru_maxrss keeps the parent's peak
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ExportStats:
+    # Timers and counters for one export. Only the exporting thread touches them,
+    # so there is no locking; observer(event, data) sees every stage as it ends.
+    def __init__(self, observer=None):
+        self.observer = observer
+        self.stages = {}
+        self.counters = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.add_time(name, time.perf_counter() - started)
+                yield item
+        finally:
+            # Closing the wrapper must still release the wrapped generator
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def add_time(self, name, seconds):
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += seconds
+        stage["calls"] += 1
+        if self.observer:
+            self.observer("stage", {"stage": name, "seconds": seconds})
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        elapsed = time.perf_counter() - self._started
+        cards = self.counters.get("cards", 0)
+        return {
+            "seconds": round(elapsed, 3),
+            "cards_per_second": round(cards / elapsed, 1) if elapsed else None,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": {
+                name: {"seconds": round(stage["seconds"], 4), "calls": stage["calls"]}
+                for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def save(self, output_base, archive=None):
+        report = self.report()
+        if archive:
+            archive.write_json(REPORT_NAME, report)
+        else:
+            with open(os.path.join(output_base, REPORT_NAME), "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if self.observer:
+            self.observer("report", report)
+        return report
+
+
+def format_summary(report, stage_count=4):
+    lines = [f"{report['counters'].get('cards', 0)} cards in {report['seconds']:.1f}s"
+             f" ({report['cards_per_second'] or 0:.0f} cards/s)"]
+    for name, stage in list(report["stages"].items())[:stage_count]:
+        lines.append(f"{name}: {stage['seconds']:.2f}s")
+    counters = report["counters"]
+    fetched = counters.get("media_bytes", 0) + counters.get("external_bytes", 0)
+    lines.append(f"Media: {fetched / 1024 / 1024:.1f} MB, {counters.get('media_cache_hits', 0)} cache hits,"
+                 f" {counters.get('media_cache_misses', 0)} misses")
+    if report["peak_rss_bytes"]:
+        lines.append(f"Peak memory: {report['peak_rss_bytes'] / 1024 / 1024:.0f} MB")
+    return "\n".join(lines)
@@ -0,0 +1,130 @@
+import errno
+import os
+import shutil
+
+MEDIA_MODES = ("auto", "reflink", "hardlink", "copy")
+HEADER_SIZE = 64
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Linux FICLONE ioctl: share extents copy-on-write on btrfs/xfs/bcachefs
+FICLONE = 0x40049409
+
+
+def is_safe_media_name(name):
+    # Media names come from card HTML and are joined onto the media folder, so
+    # only a bare file name is accepted: no separators, drive letters or dot segments.
+    return (bool(name) and name not in (".", "..") and "/" not in name and "\\" not in name
+            and "\0" not in name and not (len(name) > 1 and name[1] == ":"))
+
+
+def sniff_media_type(header):
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header.startswith(b"BM"):
+        return "image/bmp"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if header.startswith(b"\x00\x00\x01\x00"):
+        return "image/x-icon"
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"RIFF") and header[8:12] == b"WAVE":
+        return "audio/wav"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand in (b"heic", b"heix", b"mif1"):
+            return "image/heic"
+        if brand in (b"M4A ", b"M4B "):
+            return "audio/mp4"
+        return "video/mp4"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if header.startswith(b"OggS"):
+        return "audio/ogg"
+    if header.startswith(b"fLaC"):
+        return "audio/flac"
+    if header.startswith(b"ID3") or header[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    text = header.lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in header.lower()):
+        return "image/svg+xml"
+    return None
+
+
+def detect_media_type(path):
+    with open(path, "rb") as f:
+        return sniff_media_type(f.read(HEADER_SIZE))
+
+
+def _reflink(src, dest):
+    import fcntl
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+        fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy_file_range(src, dest):
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdest.fileno(), min(remaining, 1 << 30))
+            if copied == 0:
+                break
+            remaining -= copied
+        if remaining:
+            raise OSError(errno.EIO, "copy_file_range stopped early")
+
+
+def _stream_copy(src, dest):
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+        shutil.copyfileobj(fsrc, fdest, COPY_CHUNK_SIZE)
+
+
+def _strategies(mode):
+    if mode == "hardlink":
+        return [("hardlink", os.link)]
+    if mode == "reflink":
+        return [("reflink", _reflink)]
+    strategies = []
+    if mode == "auto":
+        strategies.append(("reflink", _reflink))
+        strategies.append(("hardlink", os.link))
+    if hasattr(os, "copy_file_range"):
+        strategies.append(("copy_file_range", _copy_file_range))
+    strategies.append(("copy", _stream_copy))
+    return strategies
+
+
+def materialize_file(src, dest, mode="auto"):
+    if mode not in MEDIA_MODES:
+        raise ValueError(f"Unknown media mode: {mode}")
+    if os.path.realpath(src) == os.path.realpath(dest):
+        # Unlinking dest below would delete src itself
+        raise OSError(errno.EINVAL, f"Refusing to replace {src} with itself")
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    last_error = None
+    for method, place in _strategies(mode):
+        # Never write through an existing path: it may be a hardlink into the source folder
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        try:
+            place(src, dest)
+            return method
+        except (OSError, ImportError) as e:
+            last_error = e
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    raise last_error
+
+
+def write_media_bytes(data, dest):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    with open(dest, "wb") as f:
+        f.write(data)
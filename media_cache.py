@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .media import materialize_file, write_media_bytes
+
+INDEX_NAME = "index.json"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class MediaCache:
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, link_mode="auto"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.root, INDEX_NAME), encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose object vanished behind our back
+        return {key: entry for key, entry in entries.items() if os.path.exists(self._object_path(key))}
+
+    def _object_path(self, key):
+        return os.path.join(self.root, "objects", key[:2], key)
+
+    @staticmethod
+    def key_for(namespace, name):
+        # Collection media is namespaced by its collection (see media_namespace() on
+        # the sources), so exports of different profiles sharing this cache never
+        # see each other's files; external URLs are treated as immutable.
+        return hashlib.sha1(f"{namespace}\0{name}".encode("utf-8")).hexdigest()
+
+    def fetch(self, key, dest):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False
+            entry["atime"] = time.time()
+        try:
+            materialize_file(self._object_path(key), dest, self.link_mode)
+        except OSError:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def lookup(self, key):
+        # Path of the cached object for readers that copy it somewhere themselves
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(self._object_path(key)):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            entry["atime"] = time.time()
+            self.hits += 1
+        return self._object_path(key)
+
+    def store(self, key, src_path):
+        path = self._object_path(key)
+        try:
+            materialize_file(src_path, path, self.link_mode)
+        except OSError as e:
+            print(f"Could not add {src_path} to media cache: {e}")
+            return
+        with self._lock:
+            self._entries[key] = {"size": os.path.getsize(path), "atime": time.time()}
+
+    def store_bytes(self, key, data):
+        path = self._object_path(key)
+        try:
+            write_media_bytes(data, path)
+        except OSError as e:
+            print(f"Could not add {key} to media cache: {e}")
+            return
+        with self._lock:
+            self._entries[key] = {"size": len(data), "atime": time.time()}
+
+    def size(self):
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def evict(self):
+        with self._lock:
+            total = sum(entry["size"] for entry in self._entries.values())
+            evicted = 0
+            for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["atime"]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(self._object_path(key))
+                except FileNotFoundError:
+                    pass
+                total -= entry["size"]
+                del self._entries[key]
+                evicted += 1
+            return evicted
+
+    def save(self):
+        self.evict()
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, INDEX_NAME)
+        with self._lock:
+            data = json.dumps(self._entries)
+        # Exports sharing this cache may save concurrently
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
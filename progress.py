@@ -0,0 +1,76 @@
+import time
+
+MIN_INTERVAL = 0.1
+MAX_INTERVAL = 1.0
+PERCENT_STEP = 1.0
+RATE_SMOOTHING = 0.3
+
+
+class ProgressReporter:
+    # update() runs once per card and stays cheap; the callback only fires when
+    # the percentage moved by PERCENT_STEP (at most every MIN_INTERVAL) or when
+    # MAX_INTERVAL passed, so slow exports still show a live throughput and ETA.
+    # unit names what done and total count: cards, or notes in note mode.
+    def __init__(self, total, callback, stats=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 percent_step=PERCENT_STEP, unit="cards"):
+        self.total = total
+        self.unit = unit
+        self.callback = callback
+        self.stats = stats
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.percent_step = percent_step
+        self.started = time.monotonic()
+        self.rate = None
+        self._last_time = self.started
+        self._last_done = 0
+        self._last_percent = -percent_step
+
+    def update(self, done):
+        if not self.callback:
+            return
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        if done < self.total and elapsed < self.max_interval:
+            if elapsed < self.min_interval:
+                return
+            if done * 100 / self.total - self._last_percent < self.percent_step:
+                return
+        self._emit(done, now)
+
+    def _emit(self, done, now):
+        elapsed = now - self._last_time
+        # The time before the first card includes the first fetch, so the rate starts after it
+        if elapsed > 0 and self._last_done:
+            rate = (done - self._last_done) / elapsed
+            self.rate = rate if self.rate is None else self.rate + RATE_SMOOTHING * (rate - self.rate)
+        self._last_time = now
+        self._last_done = done
+        self._last_percent = done * 100 / self.total if self.total else 100
+        self.callback(self.snapshot(done, now))
+
+    def snapshot(self, done, now=None):
+        now = now or time.monotonic()
+        counters = self.stats.counters if self.stats else {}
+        remaining = self.total - done
+        return {
+            "cards": done,
+            "total": self.total,
+            "unit": self.unit,
+            "percent": int(done * 100 / self.total) if self.total else 100,
+            "media": sum(counters.get(name, 0) for name in
+                         ("media_copied", "media_retrieved", "media_reused", "external_files")),
+            "bytes": sum(counters.get(name, 0) for name in ("html_bytes", "media_bytes", "external_bytes")),
+            "cards_per_second": round(self.rate or 0, 1),
+            "elapsed": round(now - self.started, 1),
+            "eta": round(remaining / self.rate, 1) if self.rate and remaining else (0 if not remaining else None),
+        }
+
+
+def format_progress(progress):
+    unit = progress["unit"]
+    text = (f"{progress['cards']}/{progress['total']} {unit}, {progress['media']} media,"
+            f" {progress['bytes'] / 1024 / 1024:.1f} MB written, {progress['cards_per_second']:.0f} {unit}/s")
+    if progress["eta"] is not None and progress["cards"] < progress["total"]:
+        text += f", ETA {progress['eta']:.0f}s"
+    return text
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .rendering import render_batch
+
+RENDER_BATCH_SIZE = 64
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_NAME = __name__.rpartition(".")[0]
+# Run by exec() as the worker initializer (a builtin, so it unpickles before the
+# package exists): registers the add-on folder as a bare package like
+# headless.load_addon_module, so workers import its modules without Anki.
+REGISTER_PACKAGE = """
+import sys, types
+if name not in sys.modules:
+    package = types.ModuleType(name)
+    package.__path__ = [path]
+    sys.modules[name] = package
+"""
+
+
+def gil_disabled():
+    return hasattr(sys, "_is_gil_enabled") and not sys._is_gil_enabled()
+
+
+def worker_executor(workers, thread_name_prefix):
+    # Inside Anki the pool is threads: forking the running Qt process can deadlock
+    # (macOS in particular) and sys.executable may be Anki itself rather than a
+    # Python that could be spawned. Elsewhere workers start from a clean interpreter.
+    if gil_disabled() or "aqt" in sys.modules:
+        return ThreadPoolExecutor(workers, thread_name_prefix=thread_name_prefix)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=exec,
+                               initargs=(REGISTER_PACKAGE, {"name": PACKAGE_NAME, "path": ADDON_DIR}))
+
+
+class RenderPool:
+    def __init__(self, workers=None, batch_size=RENDER_BATCH_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._executor = None
+        if self.workers <= 1:
+            return
+        self._executor = worker_executor(self.workers, "render")
+
+    def render(self, cards, media_map, chunks, stop_flag=None):
+        # Yields (fragment, sidecar_fields) per card, in input order. media_map is
+        # pickled once per batch, so callers pass only the entries these cards use.
+        if self._executor is None:
+            for card, chunk in zip(cards, chunks):
+                if stop_flag and stop_flag():
+                    return
+                yield render_batch([card], media_map, [chunk])[0]
+            return
+
+        futures = []
+        for start in range(0, len(cards), self.batch_size):
+            futures.append(self._executor.submit(render_batch, cards[start:start + self.batch_size], media_map,
+                                                 chunks[start:start + self.batch_size]))
+        try:
+            for future in futures:
+                for rendered in future.result():
+                    if stop_flag and stop_flag():
+                        return
+                    yield rendered
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,180 @@
+import html
+import re
+import urllib.parse
+
+# Both patterns start with a literal, which lets the regex engine skip ahead at
+# C speed instead of trying an alternation at every character.
+TAGS_CONTAINER_RE = re.compile(r'<div id="tags-container".*?>.*?</div>', re.DOTALL | re.IGNORECASE)
+SRC_RE = re.compile(r'src\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+SIZED_RE = re.compile(r'\s(?:width|height)\s*=', re.IGNORECASE)
+# Cards are at most 900px wide and shrink to 90% of narrower screens
+IMAGE_SIZES = "(max-width: 1000px) 90vw, 900px"
+HIDDEN_FIELDS = ("front", "question")
+
+
+def is_external_url(url):
+    return url.startswith("http://") or url.startswith("https://")
+
+
+def image_attributes(image, quote, sized=False):
+    # image comes from images.image_source(); sizes the author set on the tag are kept
+    attributes = [("src", image["src"])]
+    if image.get("srcset"):
+        attributes += [("srcset", image["srcset"]), ("sizes", IMAGE_SIZES)]
+    if image.get("width") and not sized:
+        attributes += [("width", str(image["width"])), ("height", str(image["height"]))]
+    attributes.append(("loading", "lazy"))
+    if image.get("original"):
+        attributes += [("data-original", image["original"]),
+                       ("onclick", "openExtraInfo(this.dataset.original, true, false)")]
+    return " ".join(f"{name}={quote}{html.escape(value)}{quote}" for name, value in attributes)
+
+
+def scan_html(text, media_map=None):
+    # One walk over the text returning (clean, rewritten, media): clean has the
+    # tags container removed, rewritten additionally points every mapped src at
+    # its local path and media lists the src values in order. A mapped value can
+    # also be an image source dict, which replaces the src with image attributes.
+    clean = []
+    rewritten = []
+    media = []
+    pos = 0
+    containers = [match.span() for match in TAGS_CONTAINER_RE.finditer(text)] if "tags-container" in text else []
+    containers.append((len(text), len(text)))
+    for container_start, container_end in containers:
+        for match in SRC_RE.finditer(text, pos, container_start):
+            start, end = match.span()
+            # Only a real attribute, not data-src= or similar
+            if start and not text[start - 1].isspace():
+                continue
+            raw = match.group(1)
+            quote = '"'
+            if raw is None:
+                raw, quote = match.group(2), "'"
+            if not raw:
+                continue
+            name = html.unescape(raw) if "&" in raw else raw
+            media.append(name)
+            local_path = media_map.get(name) if media_map else None
+            if not local_path:
+                continue
+            chunk = text[pos:start]
+            clean.append(chunk)
+            clean.append(text[start:end])
+            rewritten.append(chunk)
+            if isinstance(local_path, dict):
+                tag = text[text.rfind("<", 0, start):text.find(">", end)]
+                rewritten.append(image_attributes(local_path, quote, SIZED_RE.search(tag) is not None))
+            else:
+                rewritten.append(f"src={quote}{html.escape(local_path)}{quote}")
+            pos = end
+        chunk = text[pos:container_start]
+        clean.append(chunk)
+        rewritten.append(chunk)
+        pos = container_end
+    return "".join(clean), "".join(rewritten), media
+
+
+def strip_tags_container(answer):
+    return TAGS_CONTAINER_RE.sub("", answer)
+
+
+def extract_media_filenames(html_content):
+    return scan_html(html_content)[2]
+
+
+def extra_fields(card, answer):
+    # answer is the cleaned answer; `in` is a single C-level substring search per field
+    for field_name, content in card.get("fields", {}).items():
+        val = content.get("value", "").strip()
+        if not val or field_name.lower() in HIDDEN_FIELDS or val in answer:
+            continue
+        yield field_name, val
+
+
+def card_media_filenames(card):
+    if "cards" in card:
+        return note_media_filenames(card)
+    answer, _, media = scan_html(card.get("answer", ""))
+    for _, val in extra_fields(card, answer):
+        media.extend(scan_html(val)[2])
+    return media
+
+
+def note_media_filenames(note):
+    answers = []
+    media = []
+    for card in note["cards"]:
+        answer, _, card_media = scan_html(card.get("answer", ""))
+        answers.append(answer)
+        media.extend(card_media)
+    for _, val in extra_fields(note, "\0".join(answers)):
+        media.extend(scan_html(val)[2])
+    return media
+
+
+def collect_media_filenames(cards):
+    filenames = {}
+    for card in cards:
+        for media_file in card_media_filenames(card):
+            filenames[media_file] = None
+    return list(filenames)
+
+
+def render_answer(card, media_map):
+    clean, answer, media = scan_html(card.get("answer", ""), media_map)
+    for media_file in dict.fromkeys(media):
+        if media_file not in media_map and is_external_url(media_file):
+            answer += f"<button class='extra-info-button' onclick=\"openExtraInfo('{media_file}', false, true)\">External Media</button>"
+    return clean, answer
+
+
+def render_extras(card, shown, media_map, field_chunk, parts):
+    # Appends the field buttons and tags; shown is the cleaned answer text the fields are checked against
+    sidecar_fields = {}
+    for field_name, val in extra_fields(card, shown):
+        val = scan_html(val, media_map)[1]
+        if field_chunk is not None:
+            sidecar_fields[field_name] = val
+            parts.append(f"<button class='extra-info-button' onclick=\"openExtraField(this)\" data-chunk='{field_chunk}' data-card='{card['cardId']}' data-field='{html.escape(field_name, quote=True)}'>{html.escape(field_name)}</button>")
+            continue
+        val_encoded = urllib.parse.quote(val)
+        parts.append(f"<button class='extra-info-button' onclick=\"openExtraInfo(this.dataset.content, false, false)\" data-content='{val_encoded}'>{html.escape(field_name)}</button>")
+
+    tags = card.get("tags", [])
+    if tags:
+        parts.append(f"<p class='tags'>Tags: {', '.join(tags)}</p>")
+    return sidecar_fields
+
+
+def render_card(card, media_map, field_chunk=None):
+    # Returns (fragment, sidecar_fields). With a field_chunk the extra fields are
+    # returned for the sidecar store and the buttons only reference them.
+    clean, answer = render_answer(card, media_map)
+    parts = ["<div class='card'>"]
+    parts.append(f"<a href='#{card['cardId']}' class='card-id' id='{card['cardId']}'>Card ID: {card['cardId']}</a>")
+    parts.append(f"<div>{answer}</div>")
+    sidecar_fields = render_extras(card, clean, media_map, field_chunk, parts)
+    parts.append("</div>")
+    return "".join(parts), sidecar_fields
+
+
+def render_note(note, media_map, field_chunk=None):
+    # Shared fields, media and tags are rendered once; each card only adds its answer
+    parts = ["<div class='card note'>"]
+    parts.append(f"<a href='#{note['cardId']}' class='card-id' id='{note['cardId']}'>Note ID: {note['note']}</a>")
+    shown = []
+    for card in note["cards"]:
+        clean, answer = render_answer(card, media_map)
+        shown.append(clean)
+        parts.append(f"<div class='note-card'><a href='#{card['cardId']}' class='card-id' id='{card['cardId']}'>Card ID: {card['cardId']}</a><div>{answer}</div></div>")
+    sidecar_fields = render_extras(note, "\0".join(shown), media_map, field_chunk, parts)
+    parts.append("</div>")
+    return "".join(parts), sidecar_fields
+
+
+def render_batch(cards, media_map, chunks):
+    return [
+        (render_note if "cards" in card else render_card)(card, media_map, chunk)
+        for card, chunk in zip(cards, chunks)
+    ]
@@ -0,0 +1,230 @@
+import html
+import json
+import math
+import os
+import re
+from array import array
+from collections import defaultdict
+from itertools import chain
+
+from .rendering import extra_fields, strip_tags_container
+
+SEARCH_FOLDER = "search"
+SCRIPT_NAME = "search.js"
+META_NAME = "search-meta.js"
+DOCS_PER_CHUNK = 1000
+TERMS_PER_SHARD = 2000
+MAX_SHARDS = 256
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+TITLE_LENGTH = 100
+BLOCK_RE = re.compile(r"<(style|script)\b.*?</\1\s*>|\[sound:[^\]]*\]", re.DOTALL | re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]*>")
+# Whole words only: a longer run of word characters is skipped, not cut into pieces
+WORD_RE = re.compile(rf"\b\w{{{MIN_TERM_LENGTH},{MAX_TERM_LENGTH}}}\b")
+ASCII_WORD_RE = re.compile(WORD_RE.pattern, re.ASCII)
+
+SEARCH_SCRIPT = """
+(function () {
+    // Shards are JSONP like the field chunks so the index also loads from file://
+    var meta = null, shards = {}, docChunks = {}, waiters = {}, requested = {};
+    window.searchMeta = function (data) { meta = data; loaded("meta"); };
+    window.searchShard = function (number, terms) { shards[number] = terms; loaded("shard" + number); };
+    window.searchDocs = function (number, docs) { docChunks[number] = docs; loaded("docs" + number); };
+
+    function loaded(key) {
+        (waiters[key] || []).forEach(function (resolve) { resolve(); });
+        delete waiters[key];
+    }
+    function need(key, ready, name) {
+        if (ready()) return Promise.resolve();
+        return new Promise(function (resolve) {
+            (waiters[key] = waiters[key] || []).push(resolve);
+            if (!requested[key]) {
+                requested[key] = true;
+                loadScript("search/" + name);
+            }
+        });
+    }
+    function pad(number) { return String(number).padStart(4, "0"); }
+    function tokenize(text) {
+        return (text.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || []).filter(function (term) {
+            var length = Array.from(term).length;
+            return length >= %(min)d && length <= %(max)d;
+        });
+    }
+    function shardFor(term) {
+        var hash = 0;
+        Array.from(term).slice(0, 2).forEach(function (ch) { hash = (hash * 31 + ch.codePointAt(0)) %% 4294967296; });
+        return hash %% meta.shards;
+    }
+    function matching(term) {
+        // Every indexed term starting with the query term; postings are delta encoded
+        var terms = shards[shardFor(term)], docs = new Set();
+        for (var key in terms) {
+            if (!key.startsWith(term)) continue;
+            var doc = 0;
+            terms[key].forEach(function (delta) { doc += delta; docs.add(doc); });
+        }
+        return docs;
+    }
+    async function search(query) {
+        var terms = tokenize(query);
+        if (!terms.length) return null;
+        await need("meta", function () { return meta; }, "%(meta)s");
+        await Promise.all(terms.map(function (term) {
+            var number = shardFor(term);
+            return need("shard" + number, function () { return shards[number]; }, "terms-" + pad(number) + ".js");
+        }));
+        var found = null;
+        terms.forEach(function (term) {
+            var docs = matching(term);
+            found = found ? found.filter(function (doc) { return docs.has(doc); })
+                          : Array.from(docs).sort(function (a, b) { return a - b; });
+        });
+        return found;
+    }
+    async function describe(found, limit) {
+        var shown = found.slice(0, limit);
+        await Promise.all(Array.from(new Set(shown.map(function (doc) { return Math.floor(doc / meta.docsPerChunk); })),
+            function (number) {
+                return need("docs" + number, function () { return docChunks[number]; }, "docs-" + pad(number) + ".js");
+            }));
+        return shown.map(function (doc) { return docChunks[Math.floor(doc / meta.docsPerChunk)][doc %% meta.docsPerChunk]; });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        var box = document.createElement("div");
+        box.className = "search-box";
+        box.innerHTML = "<input type='search' placeholder='Search cards'><div class='search-results'></div>";
+        document.body.insertBefore(box, document.body.firstChild);
+        var input = box.querySelector("input"), results = box.querySelector(".search-results");
+        var timer = null, latest = 0;
+        function note(text) {
+            var line = document.createElement("p");
+            line.textContent = text;
+            results.appendChild(line);
+        }
+        async function run() {
+            var current = ++latest;
+            var found = await search(input.value);
+            var docs = found && found.length ? await describe(found, %(limit)d) : [];
+            if (current !== latest) return;
+            results.textContent = "";
+            if (!found) return;
+            note(found.length + (found.length === 1 ? " card" : " cards"));
+            docs.forEach(function (doc) {
+                var link = document.createElement("a");
+                link.href = meta.pages[doc[1]] + "#" + doc[0];
+                link.textContent = doc[2] || String(doc[0]);
+                results.appendChild(link);
+            });
+            if (found.length > docs.length) note("Showing the first " + docs.length);
+        }
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(run, 150);
+        });
+    });
+})();
+""" % {"min": MIN_TERM_LENGTH, "max": MAX_TERM_LENGTH, "meta": META_NAME, "limit": 50}
+
+
+def plain_text(value):
+    text = TAG_RE.sub(" ", BLOCK_RE.sub(" ", value))
+    return html.unescape(text) if "&" in text else text
+
+
+def tokenize(text):
+    text = text.lower()
+    # Same words for ASCII text, without the Unicode category lookups per character
+    return (ASCII_WORD_RE if text.isascii() else WORD_RE).findall(text)
+
+
+def card_terms(card):
+    # The text the export shows: answers, the extra fields not already in them and
+    # the tags, joined so it is scanned once; each term is returned once per card.
+    answers = [nested.get("answer", "") for nested in card["cards"]] if "cards" in card else [card.get("answer", "")]
+    extras = [value for _, value in extra_fields(card, "\0".join(answers))]
+    first = answers.pop(0) if answers else ""
+    first = plain_text(strip_tags_container(first) if "tags-container" in first else first)
+    text = " ".join([first, plain_text(" ".join(answers + extras)), *card.get("tags", ())])
+    return " ".join(first.split())[:TITLE_LENGTH], list(set(tokenize(text)))
+
+
+def shard_for(term, shards):
+    # Mirrors shardFor() in SEARCH_SCRIPT: terms sharing their first two characters share a shard
+    value = 0
+    for ch in term[:2]:
+        value = (value * 31 + ord(ch)) % 4294967296
+    return value % shards
+
+
+class SearchIndex:
+    # Documents are card ordinals. Their titles and page locations are written in
+    # chunks while the export runs; postings stay in compact arrays until close()
+    # writes them as term shards that the page's search box loads on demand.
+    def __init__(self, output_base, archive=None):
+        self.folder = os.path.join(output_base, SEARCH_FOLDER)
+        self.archive = archive
+        self.postings = defaultdict(lambda: array("I"))
+        self.pages = {}
+        self.doc_count = 0
+        self._docs = []
+        if not archive:
+            os.makedirs(self.folder, exist_ok=True)
+
+    def add(self, card_id, file_name, card):
+        title, terms = card_terms(card)
+        self._add(card_id, file_name, title, terms)
+        return title, terms
+
+    def _add(self, card_id, file_name, title, terms):
+        ordinal = self.doc_count
+        postings = self.postings
+        for term in terms:
+            postings[term].append(ordinal)
+        page = self.pages.setdefault(file_name, len(self.pages))
+        self._docs.append([str(card_id), page, title])
+        self.doc_count += 1
+        if len(self._docs) == DOCS_PER_CHUNK:
+            self._flush_docs()
+
+    def restore(self, cards):
+        # Journal entries of an interrupted export carry [title, terms] under "search"
+        for card_id, entry in cards:
+            title, terms = entry["search"]
+            self._add(card_id, entry["file"], title, terms.split())
+
+    def _write(self, name, text):
+        if self.archive:
+            self.archive.write_bytes(f"{SEARCH_FOLDER}/{name}", text.encode("utf-8"))
+        else:
+            with open(os.path.join(self.folder, name), "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def _flush_docs(self):
+        if not self._docs:
+            return
+        number = (self.doc_count - 1) // DOCS_PER_CHUNK
+        self._write(f"docs-{number:04d}.js", f"searchDocs({number},{json.dumps(self._docs, ensure_ascii=False)});\n")
+        self._docs = []
+
+    def close(self):
+        self._flush_docs()
+        shard_count = min(MAX_SHARDS, max(1, math.ceil(len(self.postings) / TERMS_PER_SHARD)))
+        shards = [[] for _ in range(shard_count)]
+        for term in sorted(self.postings):
+            shards[shard_for(term, shard_count)].append(term)
+        for number, terms in enumerate(shards):
+            encoded = {}
+            for term in terms:
+                postings = self.postings[term]
+                encoded[term] = [doc - previous for doc, previous in zip(postings, chain((0,), postings))]
+            self._write(f"terms-{number:04d}.js",
+                        f"searchShard({number},{json.dumps(encoded, ensure_ascii=False, separators=(',', ':'))});\n")
+        meta = {"shards": shard_count, "docs": self.doc_count, "docsPerChunk": DOCS_PER_CHUNK,
+                "pages": list(self.pages)}
+        self._write(META_NAME, f"searchMeta({json.dumps(meta, ensure_ascii=False)});\n")
+        self._write(SCRIPT_NAME, SEARCH_SCRIPT)
+        return len(self.postings)
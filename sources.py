@@ -0,0 +1,179 @@
+import base64
+import os
+
+from .anki_client import AnkiConnectClient, AnkiConnectError
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def media_file_path(media_dir, filename):
+    # Card HTML controls filename: absolute or ../ names must not reach files outside the media folder
+    root = os.path.realpath(media_dir)
+    path = os.path.realpath(os.path.join(root, filename))
+    if os.path.dirname(path) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+class AnkiConnectSource:
+    name = "AnkiConnect"
+
+    def __init__(self, client=None):
+        self.client = client or AnkiConnectClient()
+        self._media_dir = None
+        self._namespace = None
+
+    def media_dir(self):
+        # The media folder is only usable directly when AnkiConnect runs on this machine
+        if self._media_dir is None:
+            self._media_dir = ""
+            if self.client.host in LOCAL_HOSTS:
+                try:
+                    path = self.client.request("getMediaDirPath")
+                except AnkiConnectError as e:
+                    print("Could not resolve media folder:", e)
+                    path = None
+                if path and os.path.isdir(path):
+                    self._media_dir = path
+        return self._media_dir
+
+    def media_namespace(self):
+        # Names the collection behind this connection in media cache keys; the media
+        # folder path includes the profile, so it also tells remote profiles apart.
+        if self._namespace is None:
+            try:
+                path = self.client.request("getMediaDirPath")
+            except AnkiConnectError as e:
+                print("Could not resolve media folder:", e)
+                path = ""
+            self._namespace = f"ankiconnect:{self.client.host}:{self.client.port}:{path}"
+        return self._namespace
+
+    def find_cards(self, query):
+        return self.client.request("findCards", {"query": query})
+
+    def cards_info(self, card_ids):
+        return self.client.request("cardsInfo", {"cards": card_ids})
+
+    def find_notes(self, query):
+        return self.client.request("findNotes", {"query": query})
+
+    def notes_info(self, note_ids):
+        return self.client.request("notesInfo", {"notes": note_ids})
+
+    def note_mod_times(self, note_ids):
+        return {
+            entry["noteId"]: entry["mod"]
+            for entry in self.client.request("notesModTime", {"notes": note_ids})
+        }
+
+    def media_path(self, filename):
+        media_dir = self.media_dir()
+        if not media_dir:
+            return None
+        return media_file_path(media_dir, filename)
+
+    def retrieve_media(self, filenames):
+        results = self.client.multi([("retrieveMediaFile", {"filename": name}) for name in filenames])
+        media = {}
+        for name, result in zip(filenames, results):
+            # multi wraps each result in {"result", "error"} when the action carries a version
+            if isinstance(result, dict):
+                if result.get("error"):
+                    print(f"AnkiConnect error for {name}:", result["error"])
+                    continue
+                result = result.get("result")
+            if result:
+                media[name] = base64.b64decode(result)
+        return media
+
+    def close(self):
+        self.client.close()
+
+
+class CollectionSource:
+    name = "Collection"
+
+    def __init__(self, col=None):
+        if col is None:
+            from aqt import mw
+            col = mw.col
+        self.col = col
+
+    def find_cards(self, query):
+        return list(self.col.find_cards(query))
+
+    def cards_info(self, card_ids):
+        notes = {}
+        cards = []
+        for card_id in card_ids:
+            card = self.col.get_card(card_id)
+            note = notes.get(card.nid)
+            if note is None:
+                note = notes[card.nid] = card.note()
+            cards.append({
+                "cardId": card.id,
+                "note": note.id,
+                "mod": card.mod,
+                "noteMod": note.mod,
+                "answer": card.answer(),
+                "fields": {
+                    name: {"value": value, "order": order}
+                    for order, (name, value) in enumerate(note.items())
+                },
+                "tags": list(note.tags),
+            })
+        return cards
+
+    def find_notes(self, query):
+        return list(self.col.find_notes(query))
+
+    def notes_info(self, note_ids):
+        notes = []
+        for note_id in note_ids:
+            note = self.col.get_note(note_id)
+            notes.append({
+                "noteId": note.id,
+                "mod": note.mod,
+                "fields": {
+                    name: {"value": value, "order": order}
+                    for order, (name, value) in enumerate(note.items())
+                },
+                "tags": list(note.tags),
+                "cards": list(note.card_ids()),
+            })
+        return notes
+
+    def note_mod_times(self, note_ids):
+        return {note_id: self.col.get_note(note_id).mod for note_id in note_ids}
+
+    def media_dir(self):
+        return self.col.media.dir()
+
+    def media_namespace(self):
+        return f"collection:{os.path.realpath(self.media_dir())}"
+
+    def media_path(self, filename):
+        return media_file_path(self.media_dir(), filename)
+
+    def retrieve_media(self, filenames):
+        media = {}
+        for name in filenames:
+            path = self.media_path(name)
+            if path:
+                with open(path, "rb") as f:
+                    media[name] = f.read()
+        return media
+
+    def close(self):
+        pass
+
+
+def default_source():
+    try:
+        from aqt import mw
+    except ImportError:
+        mw = None
+    if mw is not None and mw.col is not None:
+        return CollectionSource(mw.col)
+    return AnkiConnectSource()
@@ -0,0 +1,50 @@
+from bisect import bisect_left
+
+SEPARATOR = "::"
+# Sorts after every character that can follow a prefix, used to skip whole subtrees
+PREFIX_END = "\U0010ffff"
+
+
+class TagIndex:
+    def __init__(self, tags):
+        pairs = sorted((tag.casefold(), tag) for tag in tags)
+        self._keys = [key for key, _ in pairs]
+        self._tags = [tag for _, tag in pairs]
+
+    def __len__(self):
+        return len(self._tags)
+
+    def complete(self, text, limit=50):
+        # Suggestions stop at the next "::" after the typed text, so a hierarchy is
+        # completed one level at a time ("Subject::Topic::" leads into its children).
+        prefix = text.casefold()
+        cut = prefix.rfind(SEPARATOR)
+        level_start = cut + len(SEPARATOR) if cut >= 0 else 0
+        keys = self._keys
+        results = []
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and len(results) < limit:
+            key = keys[i]
+            if not key.startswith(prefix):
+                break
+            end = key.find(SEPARATOR, level_start)
+            if end < 0:
+                results.append(self._tags[i])
+                i += 1
+                continue
+            node_key = key[:end]
+            results.append(self._tags[i][:end] + SEPARATOR)
+            i = bisect_left(keys, node_key + SEPARATOR + PREFIX_END, i)
+        return results
+
+
+class TagIndexCache:
+    def __init__(self):
+        self._key = None
+        self._index = None
+
+    def get(self, key, load_tags):
+        if self._index is None or key != self._key:
+            self._index = TagIndex(load_tags())
+            self._key = key
+        return self._index
@@ -1,7 +1,9 @@
 from PyQt6.QtWidgets import QWidget, QLineEdit, QHBoxLayout, QLabel, QPushButton, QCompleter
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, pyqtSignal, QStringListModel, QTimer
 from PyQt6.QtGui import QKeyEvent
 
+from .tag_index import TagIndex, SEPARATOR
+
 
 class TagChip(QWidget):
     def __init__(self, tag, parent_layout):
@@ -40,10 +42,12 @@ class TagChip(QWidget):
 class TagInputWidget(QWidget):
     tagChanged = pyqtSignal()
 
-    def __init__(self, tag_list):
+    def __init__(self, tag_source):
         super().__init__()
         self.tags = []
-        self.tag_list = tag_list
+        # Either a list of tags or a callable returning a TagIndex, resolved on first keystroke
+        self.tag_source = tag_source
+        self._tag_index = None
 
         self.layout = QHBoxLayout(self)
         self.layout.setSpacing(4)
@@ -53,16 +57,41 @@ class TagInputWidget(QWidget):
         self.input.setPlaceholderText("Type and press Enter to confirm tag")
         self.input.returnPressed.connect(self.add_tag_from_input)
 
-        self.completer = QCompleter(tag_list)
+        self.completion_model = QStringListModel(self)
+        self.completer = QCompleter(self.completion_model, self)
         self.completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        # The model already holds only matching suggestions for the current level
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
         self.completer.activated.connect(self.insert_completion_only)
-        self.input.setCompleter(self.completer)
+        self.completer.setWidget(self.input)
+        self.input.textEdited.connect(self.update_completions)
 
         self.layout.addWidget(self.input)
 
+    def tag_index(self):
+        if self._tag_index is None:
+            if callable(self.tag_source):
+                self._tag_index = self.tag_source()
+            else:
+                self._tag_index = TagIndex(self.tag_source)
+        return self._tag_index
+
+    def update_completions(self, text):
+        if not text:
+            self.completer.popup().hide()
+            return
+        self.completion_model.setStringList(self.tag_index().complete(text))
+        if self.completion_model.rowCount():
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
     def insert_completion_only(self, tag):
         self.input.setText(tag)
         self.input.setFocus()  # Let user press Enter to confirm
+        if tag.endswith(SEPARATOR):
+            # Open the next level once the popup that emitted this has closed
+            QTimer.singleShot(0, lambda: self.update_completions(tag))
 
     def keyPressEvent(self, event: QKeyEvent):
         if event.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
@@ -74,6 +103,8 @@ class TagInputWidget(QWidget):
 
     def add_tag_from_input(self):
         tag = self.input.text().strip()
+        if tag.endswith(SEPARATOR):
+            tag = tag[:-len(SEPARATOR)]
         if tag and tag not in self.tags:
             chip = TagChip(tag, self)
             self.layout.insertWidget(self.layout.count() - 1, chip)